@@ -1,16 +1,22 @@
 import datetime
+import hashlib
 import json
 import logging
+import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
-import requests
 from django.conf import settings
-from django.db.models import Count, Max
+from django.core.cache import cache
+from django.db import transaction
 from django.utils import timezone
 from django.utils.timezone import make_aware
 from requests.exceptions import ConnectionError, ConnectTimeout, ReadTimeout
 
-from dining.models import DiningItem, DiningMenu, DiningStation, Venue
+from dining.models import ALLERGENS, DIETS, DiningItem, DiningMenu, DiningStation, Venue, to_flags
+from dining.utils.menu_view_cache import get_menu_view_cache, render_menu_view_cache
+from dining.utils.search_index import build_search_index
+from utils import http
+from utils.cache import Cache, shared_token, single_flight
 from utils.errors import APIError
 
 
@@ -19,34 +25,41 @@ logger = logging.getLogger(__name__)
 OPEN_DATA_URL = "https://3scale-public-prod-open-data.apps.k8s.upenn.edu/api/v1/dining/"
 OPEN_DATA_ENDPOINTS = {"VENUES": OPEN_DATA_URL + "venues", "MENUS": OPEN_DATA_URL + "menus"}
 
+DINING_TOKEN_KEY = "dining_token"
+
+# Fields that identify a DiningMenu, see the unique_menu constraint
+MENU_KEY = ["venue", "date", "start_time", "end_time", "service"]
+
+# Venues payload, rebuilt every hour by `refresh_venues` and only fetched on demand
+# if that job stops running
+VENUES_KEY = "dining_venues"
+VENUES_TTL = 12 * Cache.HOUR
+
 
 class DiningAPIWrapper:
     def __init__(self):
-        self.token = None
-        self.expiration = timezone.localtime()
         self.openid_endpoint = (
             "https://sso.apps.k8s.upenn.edu/auth/realms/master/protocol/openid-connect/token"
         )
 
-    def update_token(self):
-        if self.expiration > timezone.localtime():
-            return
+    def fetch_token(self):
         body = {
             "client_id": settings.DINING_ID,
             "client_secret": settings.DINING_SECRET,
             "grant_type": "client_credentials",
         }
-        response = requests.post(self.openid_endpoint, data=body).json()
+        response = http.post(self.openid_endpoint, data=body).json()
         if "error" in response:
             raise APIError(f"Dining: {response['error']}, {response.get('error_description')}")
-        self.expiration = timezone.localtime() + datetime.timedelta(seconds=response["expires_in"])
-        self.token = response["access_token"]
+        return response["access_token"], response["expires_in"]
+
+    def get_token(self):
+        """Return the dining API token shared by every thread and process."""
+        return shared_token(DINING_TOKEN_KEY, self.fetch_token)
 
     def request(self, *args, **kwargs):
         """Make a signed request to the dining API."""
-        self.update_token()
-
-        headers = {"Authorization": f"Bearer {self.token}"}
+        headers = {"Authorization": f"Bearer {self.get_token()}"}
 
         # add authorization headers
         if "headers" in kwargs:
@@ -55,7 +68,7 @@ class DiningAPIWrapper:
             kwargs["headers"] = headers
 
         try:
-            return requests.request(*args, **kwargs)
+            return http.request(*args, **kwargs)
         except (ConnectTimeout, ReadTimeout, ConnectionError):
             raise APIError("Dining: Connection timeout")
 
@@ -66,10 +79,11 @@ class DiningAPIWrapper:
         if response.status_code != 200:
             raise APIError("Dining: error connecting to API " + response.text)
         venues = response.json()["result_data"]["campuses"]["203"]["cafes"]
+        venue_map = Venue.objects.in_bulk()
         for key, value in venues.items():
             # Cleaning up json response
-            venue = Venue.objects.filter(venue_id=key).first()
-            value["name"] = venue.name
+            venue = venue_map.get(int(key))
+            value["name"] = venue.name if venue else value.get("name")
             value["image"] = venue.image_url if venue else None
 
             value["id"] = int(key)
@@ -99,9 +113,9 @@ class DiningAPIWrapper:
                     if not daypart["starttime"]:
                         removed_dayparts.add(i)
                         continue
-                    for time in ["starttime", "endtime"]:
-                        daypart[time] = datetime.datetime.strptime(
-                            day["date"] + "T" + daypart[time], "%Y-%m-%dT%H:%M"
+                    for time_field in ["starttime", "endtime"]:
+                        daypart[time_field] = datetime.datetime.fromisoformat(
+                            f"{day['date']}T{daypart[time_field]}"
                         )
                 # Remove empty dayparts (unavailable meal times)
                 day["dayparts"] = [
@@ -112,13 +126,26 @@ class DiningAPIWrapper:
             results.append(value)
         return results
 
+    def refresh_venues(self):
+        """
+        Rebuilds the cached venues payload served by the Venues view and returns it
+        """
+        venues = self.get_venues()
+        cache.set(VENUES_KEY, venues, VENUES_TTL)
+        return venues
+
+    def cached_venues(self):
+        """
+        Returns the venues payload, only calling the API if it isn't cached
+        """
+        return single_flight(VENUES_KEY, self.get_venues, VENUES_TTL)
+
     def fetch_menu(self, venue_id, date):
         """
         Calls API to fetch menu for a given venue and date
         """
-        worker = DiningAPIWrapper()  # avoid shared mutable token state across threads
         menu_base = OPEN_DATA_ENDPOINTS["MENUS"]
-        response = worker.request("GET", f"{menu_base}?cafe={venue_id}&date={date}")
+        response = self.request("GET", f"{menu_base}?cafe={venue_id}&date={date}")
         if response.status_code != 200:
             raise APIError("Dining: error connecting to API " + response.text)
         return (
@@ -126,14 +153,46 @@ class DiningAPIWrapper:
             response.json(),
         )  # also storing venue_id to later access in fetched_menus list
 
-    def load_menus(self, date=None):
+    def load_week(self, start=None):
         """
-        Loads today's menu
-        Invariant: there should be no duplicate Menus. `load_menus` should delete
-        duplicate menus for all venues for the given date.
+        Loads the menus for the 7 days from `start` (today if None) and returns the number
+        of rows written for each date. The search index and the default 7 day view span
+        every date, so they are only rebuilt once, after every date is loaded.
 
         NOTE: This method should only be used in load_next_menu.py, which is
-        run based on a cron job every day
+        run based on a cron job every hour
+        """
+        if start is None:
+            start = timezone.now().date()
+
+        rows = {}
+        changed = False
+        for delta in range(7):
+            date = start + datetime.timedelta(days=delta)
+            rows[date], date_changed = self._load_date(date)
+            changed |= date_changed
+
+        if changed:
+            build_search_index()
+        # The 7 day view is keyed by day, so it is also rendered the first time it is
+        # missing on a new day
+        if changed or get_menu_view_cache(None) is None:
+            render_menu_view_cache(None)
+        return rows
+
+    def load_menus(self, date=None):
+        """
+        Loads today's menu and returns the number of rows written
+        Invariant: there should be no duplicate Menus. `load_menus` upserts menus by
+        venue, date, times and service, so reloading a date only replaces the menus
+        that changed.
+        """
+        return self._load_date(date)[0]
+
+    def _load_date(self, date=None):
+        """
+        Loads the menus for `date` and refreshes its cached view. Returns the number of rows
+        written and whether any menu was written or deleted.
         """
         if date is None:
             date = timezone.now().date()
@@ -163,48 +222,128 @@ class DiningAPIWrapper:
                         f"Dining: error fetching menu for venue {future_to_venue[future]}"
                     )
 
-        # Process the fetched menus and load them into the database
+        # Collect every changed menu, station and item in memory, then write them in a few
+        # queries. Each menu stores a hash of its daypart and items, so menus that did not
+        # change upstream are skipped, and menus that are gone upstream are deleted.
+        start = time.monotonic()
+        loaded = {
+            (menu["venue_id"], menu["start_time"], menu["end_time"], menu["service"]): menu
+            for menu in DiningMenu.objects.filter(
+                date=date, venue_id__in=[venue_id for venue_id, _ in fetched_menus]
+            ).values("id", "venue_id", "start_time", "end_time", "service", "content_hash")
+        }
+        kept_ids = set()
+        items = {}
+        menus = []
         for venue_id, response in fetched_menus:
             venue = venue_map[venue_id]
-            # Load new items into database
             # TODO: There is something called a "goitem" for venues like English House.
             # We are currently not loading them in
-            self.load_items(response["menus"]["items"])
-
             menu = response["menus"]["days"][0]
             dayparts = menu["cafes"][str(venue.venue_id)]["dayparts"][0]
             for daypart in dayparts:
+                station_items = {
+                    item_id: response["menus"]["items"].get(item_id)
+                    for station_data in daypart["stations"]
+                    for item_id in station_data["items"]
+                }
+                content_hash = hashlib.sha1(
+                    json.dumps([daypart, station_items], sort_keys=True).encode()
+                ).hexdigest()
+
                 # Parse the dates in data
-                for time in ["starttime", "endtime"]:
-                    daypart[time] = make_aware(
+                for time_field in ["starttime", "endtime"]:
+                    daypart[time_field] = make_aware(
                         datetime.datetime.strptime(
-                            menu["date"] + "T" + daypart[time], "%Y-%m-%dT%H:%M"
+                            menu["date"] + "T" + daypart[time_field], "%Y-%m-%dT%H:%M"
                         )
                     )
-                dining_menu = DiningMenu.objects.create(
+                key = (venue_id, daypart["starttime"], daypart["endtime"], daypart["label"])
+                if (loaded_menu := loaded.get(key)) is not None:
+                    kept_ids.add(loaded_menu["id"])
+                    if loaded_menu["content_hash"] == content_hash:
+                        continue
+
+                items.update(
+                    (item_id, item) for item_id, item in station_items.items() if item is not None
+                )
+                dining_menu = DiningMenu(
                     venue=venue,
                     date=menu["date"],
                     start_time=daypart["starttime"],
                     end_time=daypart["endtime"],
                     service=daypart["label"],
+                    content_hash=content_hash,
                 )
+                menus.append((dining_menu, daypart["stations"]))
+        stale_menus = [menu for menu in loaded.values() if menu["id"] not in kept_ids]
+
+        rows = 0
+        changed = bool(menus or stale_menus)
+        if changed:
+            with transaction.atomic():
+                rows = self.load_items(items) + self.load_stations(menus)
+                if stale_menus:
+                    DiningMenu.objects.filter(id__in=[menu["id"] for menu in stale_menus]).delete()
+
+        # Swap in the new menus for this date
+        if changed or get_menu_view_cache(date) is None:
+            render_menu_view_cache(date)
+
+        changed_venues = {dining_menu.venue_id for dining_menu, _ in menus} | {
+            menu["venue_id"] for menu in stale_menus
+        }
+        logger.info(
+            f"Dining: wrote {rows} rows and deleted {len(stale_menus)} menus for {date}, "
+            f"{len(fetched_menus) - len(changed_venues)} of {len(fetched_menus)} venues unchanged, "
+            f"in {time.monotonic() - start:.2f} seconds"
+        )
+        return rows, changed
 
-                # Append stations to dining menu
-                self.load_stations(daypart["stations"], dining_menu)
+    def load_stations(self, menus):
+        """
+        Writes `menus`, a list of unsaved DiningMenus each with the stations from its API
+        response, along with their stations and station items. Menus that were already loaded
+        are kept and their stations replaced. Returns the number of rows written.
+        """
+        # The API can repeat a daypart, in which case the last one wins
+        menus = list(
+            {
+                tuple(getattr(dining_menu, field) for field in MENU_KEY): (dining_menu, stations)
+                for dining_menu, stations in menus
+            }.values()
+        )
+        # Upsert by natural key, which also returns the ids of menus that already existed
+        DiningMenu.objects.bulk_create(
+            [dining_menu for dining_menu, _ in menus],
+            update_conflicts=True,
+            update_fields=["content_hash"],
+            unique_fields=MENU_KEY,
+        )
+        DiningStation.objects.filter(menu__in=[dining_menu.id for dining_menu, _ in menus]).delete()
 
-        # delete duplicate menus
-        self.delete_duplicate_menus(date)
+        stations = [
+            (DiningStation(name=station_data["label"], menu=dining_menu), station_data["items"])
+            for dining_menu, station_response in menus
+            for station_data in station_response
+        ]
+        DiningStation.objects.bulk_create([station for station, _ in stations])
 
-    def load_stations(self, station_response, dining_menu):
-        for station_data in station_response:
-            # TODO: This is inefficient for venues such as Houston Market
-            station = DiningStation.objects.create(name=station_data["label"], menu=dining_menu)
-            item_ids = [int(item) for item in station_data["items"]]
+        # Stations can list items that were never loaded
+        item_ids = {int(item) for _, station_items in stations for item in station_items}
+        loaded_ids = set(
+            DiningItem.objects.filter(item_id__in=item_ids).values_list("item_id", flat=True)
+        )
+        StationItem = DiningStation.items.through
+        station_items = [
+            StationItem(diningstation_id=station.id, diningitem_id=item_id)
+            for station, items in stations
+            for item_id in dict.fromkeys(int(item) for item in items)
+            if item_id in loaded_ids
+        ]
+        StationItem.objects.bulk_create(station_items)
 
-            # Bulk add the items into the station
-            items = DiningItem.objects.filter(item_id__in=item_ids)
-            station.items.add(*items)
-            station.save()
+        return len(menus) + len(stations) + len(station_items)
 
     def load_items(self, item_response):
         item_list = [
@@ -214,6 +353,8 @@ class DiningAPIWrapper:
                 description=value["description"],
                 ingredients=value["ingredients"],
                 allergens=", ".join(value["cor_icon"].values()) if value["cor_icon"] else "",
+                allergen_flags=to_flags(set((value["cor_icon"] or {}).values()), ALLERGENS),
+                diet_flags=to_flags(set((value["cor_icon"] or {}).values()), DIETS),
                 nutrition_info=json.dumps(
                     {
                         x["label"]: f"{x['value']}{x['unit']}"
@@ -232,35 +373,4 @@ class DiningAPIWrapper:
             ],
             unique_fields=[DiningItem._meta.pk.name],
         )
-
-    def delete_duplicate_menus(self, date):
-        """Delete duplicate menus for an exact `date`.
-        Will delete all but the most recently created menus for each dining hall
-        """
-        # Find groups of duplicate menus
-        duplicate_groups = (
-            DiningMenu.objects.values("venue", "date", "start_time", "end_time", "service")
-            .annotate(menu_count=Count("id"), keep_id=Max("id"))
-            .filter(menu_count__gt=1, date=date)
-        )
-
-        # Find all ids to delete
-        ids_to_delete = []
-
-        for group in duplicate_groups:
-            ids = (
-                DiningMenu.objects.filter(
-                    venue=group["venue"],
-                    date=group["date"],
-                    start_time=group["start_time"],
-                    end_time=group["end_time"],
-                    service=group["service"],
-                )
-                .exclude(id=group["keep_id"])
-                .values_list("id", flat=True)
-            )
-            ids_to_delete.extend(ids)
-
-        # Delete all duplicates
-        deleted_count, _ = DiningMenu.objects.filter(id__in=ids_to_delete).delete()
-        return deleted_count
+        return len(item_list)
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from dining.api_wrapper import DiningAPIWrapper
+
+
+class Command(BaseCommand):
+    """
+    Rebuilds the cached venues payload served by the Venues view
+    """
+
+    def handle(self, *args, **kwargs):
+        venues = DiningAPIWrapper().refresh_venues()
+        self.stdout.write(f"Refreshed {len(venues)} Dining Venues!")
@@ -0,0 +1,39 @@
+# Generated by Django 5.0.2 on 2026-10-17 21:52
+
+from django.db import migrations
+from django.db.models import F, Window
+from django.db.models.functions.window import RowNumber
+
+
+def delete_duplicate_menus(apps, schema_editor):
+    # Keep only the most recently created menu of each group before making menus unique
+    DiningMenu = apps.get_model("dining", "DiningMenu")
+    duplicate_ids = (
+        DiningMenu.objects.annotate(
+            rn=Window(
+                expression=RowNumber(),
+                partition_by=[
+                    F("venue"),
+                    F("date"),
+                    F("start_time"),
+                    F("end_time"),
+                    F("service"),
+                ],
+                order_by=[F("id").desc()],
+            )
+        )
+        .filter(rn__gt=1)
+        .values("id")
+    )
+    DiningMenu.objects.filter(id__in=duplicate_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("dining", "0006_remove_diningmenu_stations_and_more"),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_menus, migrations.RunPython.noop),
+    ]
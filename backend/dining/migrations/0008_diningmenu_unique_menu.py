@@ -0,0 +1,19 @@
+# Generated by Django 5.0.2 on 2026-10-17 21:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("dining", "0007_delete_duplicate_menus"),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name="diningmenu",
+            constraint=models.UniqueConstraint(
+                fields=("venue", "date", "start_time", "end_time", "service"), name="unique_menu"
+            ),
+        ),
+    ]
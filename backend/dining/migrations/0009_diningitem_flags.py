@@ -0,0 +1,54 @@
+# Generated by Django 5.0.2 on 2026-10-17 21:57
+
+from django.db import migrations, models
+
+
+# The dining API labels of each flag, by bit, as of this migration. Copied here so
+# replaying it always sets the same bits, whatever later happens to dining.models.
+ALLERGEN_LABELS = [
+    "Peanut",
+    "Tree Nut",
+    "Sesame",
+    "Fish",
+    "Shellfish",
+    "Wheat/Gluten",
+    "Milk",
+    "Egg",
+    "Soy",
+]
+DIET_LABELS = ["Vegetarian", "Vegan", "Kosher", "Halal", "Jain"]
+
+
+def to_flags(labels, flag_labels):
+    return sum(1 << bit for bit, label in enumerate(flag_labels) if label in labels)
+
+
+def parse_flags(apps, schema_editor):
+    DiningItem = apps.get_model("dining", "DiningItem")
+    items = list(DiningItem.objects.exclude(allergens=""))
+    for item in items:
+        labels = set(item.allergens.split(", "))
+        item.allergen_flags = to_flags(labels, ALLERGEN_LABELS)
+        item.diet_flags = to_flags(labels, DIET_LABELS)
+    DiningItem.objects.bulk_update(items, ["allergen_flags", "diet_flags"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("dining", "0008_diningmenu_unique_menu"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="diningitem",
+            name="allergen_flags",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="diningitem",
+            name="diet_flags",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(parse_flags, migrations.RunPython.noop),
+    ]
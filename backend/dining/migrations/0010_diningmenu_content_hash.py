@@ -0,0 +1,18 @@
+# Generated by Django 5.0.2 on 2026-10-17 22:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("dining", "0009_diningitem_flags"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="diningmenu",
+            name="content_hash",
+            field=models.CharField(blank=True, max_length=40),
+        ),
+    ]
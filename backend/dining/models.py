@@ -11,6 +11,44 @@ class Venue(models.Model):
         return f"{self.name}-{str(self.venue_id)}"
 
 
+# Names used by the Menus filters, mapped to the bit each one sets in the flags of DiningItem
+# and the label the dining API uses for it. The bits are stored, so an existing bit must
+# never be changed or reused. New entries take the next unused bit.
+ALLERGENS = {
+    "peanut": (0, "Peanut"),
+    "tree_nut": (1, "Tree Nut"),
+    "sesame": (2, "Sesame"),
+    "fish": (3, "Fish"),
+    "shellfish": (4, "Shellfish"),
+    "gluten": (5, "Wheat/Gluten"),
+    "milk": (6, "Milk"),
+    "egg": (7, "Egg"),
+    "soy": (8, "Soy"),
+}
+DIETS = {
+    "vegetarian": (0, "Vegetarian"),
+    "vegan": (1, "Vegan"),
+    "kosher": (2, "Kosher"),
+    "halal": (3, "Halal"),
+    "jain": (4, "Jain"),
+}
+
+
+def to_flags(labels, flags):
+    """
+    Returns the bit flags of `flags` (`ALLERGENS` or `DIETS`) whose labels are in `labels`
+    """
+    return sum(1 << bit for bit, label in flags.values() if label in labels)
+
+
+def to_mask(names, flags):
+    """
+    Returns the bit flags of `flags` (`ALLERGENS` or `DIETS`) with the given names.
+    Raises KeyError for unknown names.
+    """
+    return sum(1 << bit for bit in {flags[name][0] for name in names})
+
+
 class DiningItem(models.Model):
     item_id = models.IntegerField(primary_key=True)
     name = models.CharField(max_length=255)
@@ -21,9 +59,9 @@ class DiningItem(models.Model):
     # Technically, postgres supports json fields but that involves local postgres
     # instead of sqlite AND we don't need to query on this field
 
-    # TODO: New fields to add from allergens:
-    # vegetarian, vegan, kosher, jain, ask us
-    # peanut, tree nut, sesame, fish, wheat/gluten, milk, egg, soy
+    # bit flags of `ALLERGENS` and `DIETS`, parsed from allergens so menus can be filtered
+    allergen_flags = models.IntegerField(default=0)
+    diet_flags = models.IntegerField(default=0)
 
     def __str__(self):
         return f"{self.name}"
@@ -41,3 +79,13 @@ class DiningMenu(models.Model):
     start_time = models.DateTimeField()
     end_time = models.DateTimeField()
     service = models.CharField(max_length=255)
+    # hash of the API response for this menu and its items, to skip reloading unchanged menus
+    content_hash = models.CharField(max_length=40, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["venue", "date", "start_time", "end_time", "service"],
+                name="unique_menu",
+            )
+        ]
@@ -16,13 +16,17 @@ class DiningItemSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = DiningItem
-        fields = "__all__"
+        exclude = ("allergen_flags", "diet_flags")
 
     def get_nutrition_info(self, obj):
-        try:
-            return json.loads(obj.nutrition_info)
-        except json.JSONDecodeError:
-            return obj.nutrition_info
+        # items are repeated across stations and menus, so only decode each one once
+        decoded = self.context.setdefault("nutrition_info", {})
+        if obj.item_id not in decoded:
+            try:
+                decoded[obj.item_id] = json.loads(obj.nutrition_info)
+            except json.JSONDecodeError:
+                decoded[obj.item_id] = obj.nutrition_info
+        return decoded[obj.item_id]
 
 
 class DiningStationSerializer(serializers.ModelSerializer):
@@ -39,4 +43,4 @@ class DiningMenuSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = DiningMenu
-        fields = "__all__"
+        exclude = ("content_hash",)
@@ -1,21 +1,84 @@
+import datetime
+import hashlib
+import zlib
+
 from django.core.cache import cache
+from django.db.models import Prefetch
 from django.utils import timezone
+from django.utils.timezone import make_aware
+from rest_framework.renderers import JSONRenderer
+
+from dining.models import DiningMenu
+from dining.serializers import DiningMenuSerializer
+from utils.cache import Cache
 
 
 VIEW_CACHE_KEY = "clearable_dining_menu_view_cache"
-VIEW_CACHE_TIMEOUT = 60 * 60 * 3  # 3 hours
+# Payloads are rebuilt by every `load_week`, so they only need to outlive the daily load
+VIEW_CACHE_TIMEOUT = 2 * Cache.DAY
 
 
 def _get_key(date_param):
-    return f"{VIEW_CACHE_KEY}_{date_param if date_param is not None else timezone.now().date()}"
+    if date_param is None:
+        return f"{VIEW_CACHE_KEY}_week_{timezone.now().date()}"
+    return f"{VIEW_CACHE_KEY}_{date_param}"
+
+
+def latest_menus(date_param, items=None):
+    """
+    Returns the menus for `date_param`, or for the next 7 days if None.
+    `items` optionally narrows down the items listed in each station.
+    """
+    # TODO: We only have data for the next week, so we should 404
+    # if date_param is out of bounds
+    if date_param is not None:
+        date = make_aware(datetime.datetime.strptime(str(date_param), "%Y-%m-%d"))
+        menus = DiningMenu.objects.filter(date=date)
+    else:
+        start_date = timezone.now().date()
+        end_date = start_date + datetime.timedelta(days=6)
+        menus = DiningMenu.objects.filter(date__range=(start_date, end_date))
+
+    # No need to dedupe, the unique_menu constraint allows one menu per venue, date, times
+    # and service. Venues, stations and items for every menu in 3 queries total
+    return menus.select_related("venue").prefetch_related(
+        Prefetch("stations__items", queryset=items) if items is not None else "stations__items"
+    )
 
 
 def get_menu_view_cache(date_param):
-    return cache.get(_get_key(date_param))
+    """
+    Returns the rendered JSON of the menus for `date_param`, or None if not cached
+    """
+    key = _get_key(date_param)
+    if (version := cache.get(key)) is None:
+        return None
+    payload = cache.get(f"{key}:{version}")
+    return zlib.decompress(payload) if payload is not None else None
+
+
+def set_menu_view_cache(date_param, data, replace=True):
+    """
+    Caches `data` as the rendered menus for `date_param`. Unless `replace` is set, `data`
+    is only cached if nothing is yet, so a view rendering menus it read before a reload
+    committed can never replace the menus cached by `load_menus`.
+    """
+    payload = zlib.compress(JSONRenderer().render(data))
+    version = hashlib.sha1(payload).hexdigest()[:16]
+    key = _get_key(date_param)
+    # Write the payload before pointing readers to it, so they never see a partial menu
+    cache.set(f"{key}:{version}", payload, timeout=VIEW_CACHE_TIMEOUT)
+    if replace:
+        cache.set(key, version, timeout=VIEW_CACHE_TIMEOUT)
+    else:
+        cache.add(key, version, timeout=VIEW_CACHE_TIMEOUT)
 
 
-def set_menu_view_cache(date_param, data):
-    cache.set(_get_key(date_param), data, timeout=VIEW_CACHE_TIMEOUT)
+def render_menu_view_cache(date_param):
+    """
+    Pre-renders the menus for `date_param` (or the next 7 days if None) into the cache
+    """
+    set_menu_view_cache(date_param, DiningMenuSerializer(latest_menus(date_param), many=True).data)
 
 
 def delete_menu_view_cache(date_param):
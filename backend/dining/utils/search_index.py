@@ -0,0 +1,107 @@
+import datetime
+import re
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from dining.models import DiningStation
+from utils.cache import Cache, single_flight
+
+
+SEARCH_INDEX_KEY = "dining_search_index"
+# The index is rebuilt by every `load_week`, so it only needs to outlive the daily load
+SEARCH_INDEX_TIMEOUT = 2 * Cache.DAY
+MAX_RESULTS = 50
+
+
+def tokenize(text):
+    return set(re.findall(r"\w+", text.lower()))
+
+
+def build_search_index():
+    """
+    Indexes the names and descriptions of the items served in the next 7 days, along with
+    where and when each one is served, and stores the index in the cache
+    """
+    start_date = timezone.now().date()
+    end_date = start_date + datetime.timedelta(days=6)
+    rows = (
+        DiningStation.items.through.objects.filter(
+            diningstation__menu__date__gte=start_date, diningstation__menu__date__lte=end_date
+        )
+        .values(
+            "diningitem_id",
+            "diningitem__name",
+            "diningitem__description",
+            "diningstation__name",
+            "diningstation__menu__date",
+            "diningstation__menu__service",
+            "diningstation__menu__venue_id",
+            "diningstation__menu__venue__name",
+        )
+        .order_by("diningstation__menu__start_time", "diningstation__menu__venue_id")
+    )
+
+    items = {}
+    for row in rows:
+        item = items.setdefault(
+            row["diningitem_id"],
+            {
+                "item_id": row["diningitem_id"],
+                "name": row["diningitem__name"],
+                "description": row["diningitem__description"],
+                "servings": [],
+            },
+        )
+        item["servings"].append(
+            {
+                "venue_id": row["diningstation__menu__venue_id"],
+                "venue": row["diningstation__menu__venue__name"],
+                "date": row["diningstation__menu__date"],
+                "service": row["diningstation__menu__service"],
+                "station": row["diningstation__name"],
+            }
+        )
+
+    # token -> ids of the items with that word in their name or description
+    tokens = defaultdict(set)
+    for item_id, item in items.items():
+        for token in tokenize(f"{item['name']} {item['description']}"):
+            tokens[token].add(item_id)
+
+    search_index = {"items": items, "tokens": dict(tokens)}
+    cache.set(SEARCH_INDEX_KEY, search_index, SEARCH_INDEX_TIMEOUT)
+    return search_index
+
+
+def search_items(query):
+    """
+    Returns the items served in the next 7 days with every word of `query` (or a word
+    starting with it) in their name or description, best matches first
+    """
+    search_index = single_flight(SEARCH_INDEX_KEY, build_search_index, SEARCH_INDEX_TIMEOUT)
+    query_tokens = tokenize(query)
+    if not query_tokens:
+        return []
+
+    matches = None
+    for query_token in query_tokens:
+        item_ids = set()
+        for token, token_item_ids in search_index["tokens"].items():
+            if token.startswith(query_token):
+                item_ids |= token_item_ids
+        matches = item_ids if matches is None else matches & item_ids
+
+    items = [search_index["items"][item_id] for item_id in matches]
+    # items with more of the query in their name first
+    items.sort(
+        key=lambda item: (
+            -sum(
+                any(token.startswith(query_token) for token in tokenize(item["name"]))
+                for query_token in query_tokens
+            ),
+            item["name"],
+        )
+    )
+    return items[:MAX_RESULTS]
@@ -1,21 +1,18 @@
-import datetime
-
 from analytics.entries import FuncEntry, ViewEntry
 from django.core.cache import cache
-from django.db.models import Count, F, Window
-from django.db.models.functions.window import RowNumber
+from django.db.models import Count, F
+from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
-from django.utils import timezone
-from django.utils.timezone import make_aware
 from rest_framework import generics
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from dining.api_wrapper import APIError, DiningAPIWrapper
-from dining.models import DiningMenu, Venue
+from dining.models import ALLERGENS, DIETS, DiningItem, Venue, to_mask
 from dining.serializers import DiningMenuSerializer
-from dining.utils.menu_view_cache import get_menu_view_cache, set_menu_view_cache
+from dining.utils.menu_view_cache import get_menu_view_cache, latest_menus, set_menu_view_cache
+from dining.utils.search_index import search_items
 from pennmobile.analytics import LabsAnalytics
 from utils.cache import Cache
 
@@ -34,7 +31,7 @@ class Venues(APIView):
 
     def get(self, request):
         try:
-            return Response(d.get_venues())
+            return Response(d.cached_venues())
         except APIError as e:
             return Response({"error": str(e)}, status=400)
 
@@ -46,50 +43,74 @@ class Venues(APIView):
 class Menus(generics.ListAPIView):
     """
     GET: returns list of menus, defaulted to all objects within the week,
-    and can specify the filter for a particular day
+    and can specify the filter for a particular day.
+    Items can be filtered with `exclude` (allergens) and `diet`, both comma separated,
+    e.g. `?exclude=peanut,milk&diet=vegan`
     """
 
     serializer_class = DiningMenuSerializer
 
-    def get_queryset(self):
-        # TODO: We only have data for the next week, so we should 404
-        # if date_param is out of bounds
-        if date_param := self.kwargs.get("date"):
-            date = make_aware(datetime.datetime.strptime(date_param, "%Y-%m-%d"))
-            base = DiningMenu.objects.filter(date=date)
-        else:
-            start_date = timezone.now().date()
-            end_date = start_date + datetime.timedelta(days=6)
-            base = DiningMenu.objects.filter(date__gte=start_date, date__lte=end_date)
-        # Only returns most recently loaded menus
-        latest = base.annotate(
-            rn=Window(
-                expression=RowNumber(),
-                partition_by=[
-                    F("venue_id"),
-                    F("date"),
-                    F("service"),
-                    F("start_time"),
-                    F("end_time"),
-                ],
-                order_by=[F("id").desc()],
-            )
-        ).filter(rn=1)
+    def get_items(self):
+        """
+        Returns the items matching the `exclude` and `diet` filters, or None if unfiltered
+        """
+        exclude = [name for name in self.request.query_params.get("exclude", "").split(",") if name]
+        diet = [name for name in self.request.query_params.get("diet", "").split(",") if name]
+        if not exclude and not diet:
+            return None
+
+        allergen_mask = to_mask(exclude, ALLERGENS)
+        diet_mask = to_mask(diet, DIETS)
+        return DiningItem.objects.alias(
+            allergens_found=F("allergen_flags").bitand(allergen_mask),
+            diets_found=F("diet_flags").bitand(diet_mask),
+        ).filter(allergens_found=0, diets_found=diet_mask)
 
-        return latest
+    def get_queryset(self):
+        return latest_menus(self.kwargs.get("date"), self.get_items())
 
     def get(self, request, *args, **kwargs):
+        try:
+            items = self.get_items()
+        except KeyError as e:
+            return Response(
+                {
+                    "error": f"Unknown filter {e}, expected one of "
+                    f"exclude: {', '.join(ALLERGENS)}, diet: {', '.join(DIETS)}"
+                },
+                status=400,
+            )
+
         try:
             date_param = self.kwargs.get("date")
-            if get_menu_view_cache(date_param) is not None:
-                return Response(get_menu_view_cache(date_param))
+            # only unfiltered menus are cached
+            if items is None and (content := get_menu_view_cache(date_param)) is not None:
+                return HttpResponse(content, content_type="application/json")
             res = super().get(request, *args, **kwargs)
-            set_menu_view_cache(date_param, res.data)
+            if items is None:
+                # only load_menus replaces cached menus
+                set_menu_view_cache(date_param, res.data, replace=False)
             return res
         except APIError as e:
             return Response({"error": str(e)}, status=400)
 
 
+# Records number of item searches and logs 1
+@LabsAnalytics.record_apiview(
+    ViewEntry(name="item_search_count"),
+)
+class Search(APIView):
+    """
+    GET: returns the items served in the next 7 days that match the `q` query parameter,
+    each with the venue, date, service and station of every time it is served
+    """
+
+    def get(self, request):
+        if not (query := request.query_params.get("q", "").strip()):
+            return Response({"error": "No search query provided"}, status=400)
+        return Response(search_items(query))
+
+
 class Preferences(APIView):
     """
     GET: returns list of a User's diningpreferences
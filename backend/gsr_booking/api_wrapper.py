@@ -1,6 +1,7 @@
 import datetime
 import logging
 import re
+import time
 from abc import ABC, abstractmethod
 from enum import Enum
 from random import randint
@@ -9,6 +10,7 @@ import requests
 from bs4 import BeautifulSoup
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.db.models import F, Prefetch, Q, Sum
 from django.db.models.functions import Coalesce
 from django.shortcuts import get_object_or_404
@@ -18,6 +20,8 @@ from requests.exceptions import ConnectionError, ConnectTimeout, ReadTimeout
 
 from gsr_booking.models import GSR, GroupMembership, GSRBooking, Reservation
 from gsr_booking.serializers import GSRBookingSerializer, GSRSerializer
+from utils import http
+from utils.cache import Cache, shared_token, single_flight
 from utils.errors import APIError
 
 
@@ -41,6 +45,45 @@ ROOM_BLACKLIST = {7176, 16970, 16998, 17625}
 WHARTON_CREDIT_LIMIT = 6
 LIBCAL_CREDIT_LIMIT = 6
 
+# Client credentials tokens, shared by every worker through the cache
+LIBCAL_TOKEN_KEY = "libcal_token"
+AGH_TOKEN_KEY = "agh_libcal_token"
+
+# LibCal availability is the same for every user, so it is cached per building and date range.
+# Bookings made through us invalidate it right away, bookings made elsewhere show up within a TTL
+AVAILABILITY_TTL = Cache.MINUTE
+AVAILABILITY_KEY = "gsr_availability:{gid}:{version}:{start}:{end}"
+AVAILABILITY_VERSION_KEY = "gsr_availability_version:{gid}"
+
+
+def availability_key(gid, start, end):
+    # Every availability key of a building embeds its current version, so bumping the
+    # version invalidates all of its date ranges at once
+    version = cache.get_or_set(AVAILABILITY_VERSION_KEY.format(gid=gid), time.time_ns, None)
+    return AVAILABILITY_KEY.format(gid=gid, version=version, start=start, end=end)
+
+
+def invalidate_availability(gid):
+    cache.delete(AVAILABILITY_VERSION_KEY.format(gid=gid))
+
+
+# PennGroups memberships of each user, refreshed daily by update_seas_status. Users without
+# any AGH rooms (including SUBJECT_NOT_FOUND) are checked again sooner, so new SEAS students
+# get access the same day
+AUTHORIZED_ROOMS_TTL = Cache.DAY
+NOT_AUTHORIZED_TTL = 3 * Cache.HOUR
+AUTHORIZED_ROOMS_KEY = "penngroups_rooms:{user_id}"
+
+
+def authorized_rooms_ttl(rooms):
+    return AUTHORIZED_ROOMS_TTL if rooms else NOT_AUTHORIZED_TTL
+
+
+# The rooms in a building almost never change. They are refreshed nightly by
+# refresh_gsr_rooms, and the TTL only matters if that job stops running
+ROOM_IDS_TTL = 2 * Cache.DAY
+ROOM_IDS_KEY = "gsr_room_ids:{gid}"
+
 
 class CreditType(Enum):
     LIBCAL = "Libcal"
@@ -66,6 +109,27 @@ class AbstractBookingWrapper(ABC):
         raise NotImplementedError  # pragma: no cover
 
 
+class LibCalRoomsMixin:
+    """Cached lookup of the rooms in a LibCal category, for wrappers with a LibCal `request`"""
+
+    def fetch_room_ids(self, gid):
+        """Fetches the ids of the rooms in category `gid` from LibCal"""
+        response = self.request("GET", f"{API_URL}/1.1/space/category/{gid}").json()
+        return response[0]["items"]
+
+    def refresh_room_ids(self, gid):
+        """Refetches the cached room ids of category `gid` and returns them"""
+        room_ids = self.fetch_room_ids(gid)
+        cache.set(ROOM_IDS_KEY.format(gid=gid), room_ids, ROOM_IDS_TTL)
+        return room_ids
+
+    def get_room_ids(self, gid):
+        """Returns the ids of the rooms in category `gid`, only calling LibCal if not cached"""
+        return single_flight(
+            ROOM_IDS_KEY.format(gid=gid), lambda: self.fetch_room_ids(gid), ROOM_IDS_TTL
+        )
+
+
 class WhartonBookingWrapper(AbstractBookingWrapper):
     def request(self, *args, **kwargs):
         """Make a signed request to the Wharton GSR API."""
@@ -73,7 +137,7 @@ class WhartonBookingWrapper(AbstractBookingWrapper):
         kwargs["headers"] = {"Authorization": f"Token {settings.WHARTON_TOKEN}"}
 
         try:
-            response = requests.request(*args, **kwargs)
+            response = http.request(*args, **kwargs)
         except (ConnectTimeout, ReadTimeout, ConnectionError):
             raise APIError("Wharton: Connection timeout")
 
@@ -179,28 +243,21 @@ class WhartonBookingWrapper(AbstractBookingWrapper):
             return False
 
 
-class PennGroupsBookingWrapper(AbstractBookingWrapper):
+class PennGroupsBookingWrapper(LibCalRoomsMixin, AbstractBookingWrapper):
     """
     Handles AGH GSR bookings with SEAS permission checks.
     Uses separate LibCal credentials specific to AGH.
     """
 
-    def __init__(self):
-        # Separate LibCal token for AGH
-        self.token = None
-        self.expiration = timezone.localtime()
-
-    def update_token(self):
+    def fetch_token(self):
         """Get AGH-specific LibCal token"""
-        if self.expiration > timezone.localtime():
-            return
         body = {
             "client_id": settings.AGH_LIBCAL_ID,  # Different from regular LibCal!
             "client_secret": settings.AGH_LIBCAL_SECRET,
             "grant_type": "client_credentials",
         }
 
-        response = requests.post(f"{API_URL}/1.1/oauth/token", body)
+        response = http.post(f"{API_URL}/1.1/oauth/token", body)
 
         if response.status_code != 200:
             raise APIError(f"AGH LibCal: HTTP {response.status_code} when getting token")
@@ -210,14 +267,16 @@ class PennGroupsBookingWrapper(AbstractBookingWrapper):
         if "error" in response:
             raise APIError(f"AGH LibCal: {response['error']}, {response.get('error_description')}")
 
-        self.expiration = timezone.localtime() + datetime.timedelta(seconds=response["expires_in"])
-        self.token = response["access_token"]
+        return response["access_token"], response["expires_in"]
+
+    def get_token(self):
+        """Return the AGH LibCal token shared by every thread and process."""
+        # Separate LibCal token for AGH
+        return shared_token(AGH_TOKEN_KEY, self.fetch_token)
 
     def request(self, *args, **kwargs):
         """Make a signed request to the libcal API using AGH credentials."""
-        self.update_token()
-
-        headers = {"Authorization": f"Bearer {self.token}"}
+        headers = {"Authorization": f"Bearer {self.get_token()}"}
 
         # add authorization headers
         if "headers" in kwargs:
@@ -226,11 +285,28 @@ class PennGroupsBookingWrapper(AbstractBookingWrapper):
             kwargs["headers"] = headers
 
         try:
-            return requests.request(*args, **kwargs)
+            return http.request(*args, **kwargs)
         except (ConnectTimeout, ReadTimeout, ConnectionError):
             raise APIError("AGH LibCal: Connection timeout")
 
     def get_authorized_rooms(self, user):
+        """
+        Returns the AGH rooms the user can access, only calling PennGroups if not cached.
+        Failed lookups are not cached.
+        """
+        return single_flight(
+            AUTHORIZED_ROOMS_KEY.format(user_id=user.id),
+            lambda: self.fetch_authorized_rooms(user),
+            authorized_rooms_ttl,
+        )
+
+    def refresh_authorized_rooms(self, user):
+        """Refetches the cached AGH rooms the user can access and returns them"""
+        rooms = self.fetch_authorized_rooms(user)
+        cache.set(AUTHORIZED_ROOMS_KEY.format(user_id=user.id), rooms, authorized_rooms_ttl(rooms))
+        return rooms
+
+    def fetch_authorized_rooms(self, user):
         """
         Check which AGH rooms the user can access via PennGroups API.
         Returns dict mapping room extensions to their group info, or empty dict if none.
@@ -239,7 +315,7 @@ class PennGroupsBookingWrapper(AbstractBookingWrapper):
         try:
             # user.id is the pennid (set by LabsUserBackend at authentication time)
             url = f"{PENNGROUPS_URL}{user.id}/groups"
-            response = requests.get(
+            response = http.get(
                 url,
                 auth=HTTPBasicAuth(settings.PENNGROUPS_USERNAME, settings.PENNGROUPS_PASSWORD),
                 timeout=5,
@@ -273,14 +349,17 @@ class PennGroupsBookingWrapper(AbstractBookingWrapper):
         except Exception as e:
             raise APIError(f"PennGroups: Error accessing API: {str(e)}")
 
-    def is_seas(self, user):
+    def is_seas(self, user, refresh=False):
         """
-        Check if user has SEAS status.
+        Check if user has SEAS status, bypassing the cached rooms if `refresh` is set.
         Returns False if user doesn't have SEAS access or if API fails.
         Logs errors for monitoring.
         """
         try:
-            rooms = self.get_authorized_rooms(user)
+            if refresh:
+                rooms = self.refresh_authorized_rooms(user)
+            else:
+                rooms = self.get_authorized_rooms(user)
             return len(rooms) > 0
         except APIError as e:
             logger.error(f"PennGroups API error for {user.username}: {e}")
@@ -407,6 +486,23 @@ class PennGroupsBookingWrapper(AbstractBookingWrapper):
         if not authorized_rooms:
             return []
 
+        rooms = single_flight(
+            availability_key(gid, start, end),
+            lambda: self.fetch_availability(gid, start, end),
+            AVAILABILITY_TTL,
+        )
+
+        # Filter to authorized rooms using proper name mapping
+        authorized_extensions = set(authorized_rooms.keys())
+        return [
+            room
+            for room in rooms
+            if self.is_room_authorized(room["room_name"], authorized_extensions)
+        ]
+
+    def fetch_availability(self, gid, start, end):
+        """Fetches every AGH room in `gid` and its availabilities from LibCal"""
+
         # Fetch availability from LibCal using AGH credentials
         range_str = "availability"
         if start:
@@ -420,45 +516,29 @@ class PennGroupsBookingWrapper(AbstractBookingWrapper):
             start_datetime = None
 
         # Get items for AGH category
-        response = self.request("GET", f"{API_URL}/1.1/space/category/{gid}").json()
-        items = response[0]["items"]
-        items = ",".join([str(item) for item in items])
+        items = ",".join([str(item) for item in self.get_room_ids(gid)])
 
         response = self.request("GET", f"{API_URL}/1.1/space/item/{items}?{range_str}")
 
         if response.status_code != 200:
             raise APIError(f"AGH Reserve: Error {response.status_code} when fetching availability")
 
-        all_rooms = response.json()
-
-        # Filter to authorized rooms using proper name mapping
-        authorized_extensions = set(authorized_rooms.keys())
-
-        filtered_rooms = []
-        for room in all_rooms:
-            room_name = room.get("name", "")
-
-            # Use proper room name mapping instead of substring matching
-            if self.is_room_authorized(room_name, authorized_extensions):
-                filtered_rooms.append(
-                    {
-                        "room_name": room["name"],
-                        "id": room["id"],
-                        "availability": [
-                            {"start_time": time["from"], "end_time": time["to"]}
-                            for time in room.get("availability", [])
-                            if (
-                                not start_datetime
-                                or datetime.datetime.strptime(
-                                    time["from"][:-6], "%Y-%m-%dT%H:%M:%S"
-                                )
-                                >= start_datetime
-                            )
-                        ],
-                    }
-                )
-
-        return filtered_rooms
+        return [
+            {
+                "room_name": room.get("name", ""),
+                "id": room["id"],
+                "availability": [
+                    {"start_time": time["from"], "end_time": time["to"]}
+                    for time in room.get("availability", [])
+                    if (
+                        not start_datetime
+                        or datetime.datetime.strptime(time["from"][:-6], "%Y-%m-%dT%H:%M:%S")
+                        >= start_datetime
+                    )
+                ],
+            }
+            for room in response.json()
+        ]
 
     def get_reservations(self, user):
         """
@@ -468,33 +548,27 @@ class PennGroupsBookingWrapper(AbstractBookingWrapper):
         pass
 
 
-class LibCalBookingWrapper(AbstractBookingWrapper):
-    def __init__(self):
-        self.token = None
-        self.expiration = timezone.localtime()
-
-    def update_token(self):
-        # does not get new token if the current one is still usable
-        if self.expiration > timezone.localtime():
-            return
+class LibCalBookingWrapper(LibCalRoomsMixin, AbstractBookingWrapper):
+    def fetch_token(self):
         body = {
             "client_id": settings.GENERAL_LIBCAL_ID,
             "client_secret": settings.GENERAL_LIBCAL_SECRET,
             "grant_type": "client_credentials",
         }
 
-        response = requests.post(f"{API_URL}/1.1/oauth/token", body).json()
+        response = http.post(f"{API_URL}/1.1/oauth/token", body).json()
 
         if "error" in response:
             raise APIError(f"LibCal: {response['error']}, {response.get('error_description')}")
-        self.expiration = timezone.localtime() + datetime.timedelta(seconds=response["expires_in"])
-        self.token = response["access_token"]
+        return response["access_token"], response["expires_in"]
+
+    def get_token(self):
+        """Return the LibCal token shared by every thread and process."""
+        return shared_token(LIBCAL_TOKEN_KEY, self.fetch_token)
 
     def request(self, *args, **kwargs):
         """Make a signed request to the libcal API."""
-        self.update_token()
-
-        headers = {"Authorization": f"Bearer {self.token}"}
+        headers = {"Authorization": f"Bearer {self.get_token()}"}
 
         # add authorization headers
         if "headers" in kwargs:
@@ -503,7 +577,7 @@ class LibCalBookingWrapper(AbstractBookingWrapper):
             kwargs["headers"] = headers
 
         try:
-            return requests.request(*args, **kwargs)
+            return http.request(*args, **kwargs)
         except (ConnectTimeout, ReadTimeout, ConnectionError):
             raise APIError("LibCal: Connection timeout")
 
@@ -564,6 +638,14 @@ class LibCalBookingWrapper(AbstractBookingWrapper):
 
     def get_availability(self, gid, start, end, user):
         """Returns a list of rooms and their availabilities"""
+        return single_flight(
+            availability_key(gid, start, end),
+            lambda: self.fetch_availability(gid, start, end),
+            AVAILABILITY_TTL,
+        )
+
+    def fetch_availability(self, gid, start, end):
+        """Fetches the rooms in `gid` and their availabilities from LibCal"""
 
         # adjusts url based on start and end times
         range_str = "availability"
@@ -577,11 +659,8 @@ class LibCalBookingWrapper(AbstractBookingWrapper):
         else:
             start_datetime = None
 
-        # filters categories and then gets extra information on each room
-
-        response = self.request("GET", f"{API_URL}/1.1/space/category/{gid}").json()
-        items = response[0]["items"]
-        items = ",".join([str(item) for item in items])
+        # gets extra information on each room in the category
+        items = ",".join([str(item) for item in self.get_room_ids(gid)])
         response = self.request("GET", f"{API_URL}/1.1/space/item/{items}?{range_str}")
 
         if response.status_code != 200:
@@ -807,6 +886,9 @@ class BookingHandler:
                 f"{str(e)}. Was only able to book {start.strftime('%H:%M')}"
                 f" - {curr_start.strftime('%H:%M')}"
             )
+        finally:
+            # even a partial booking takes rooms out of the shared availability
+            invalidate_availability(gsr.gid)
 
         return reservation
 
@@ -828,6 +910,7 @@ class BookingHandler:
                 cancel_func = self.LBW.cancel_room
 
             cancel_func(booking_id, gsr_booking.user)
+            invalidate_availability(gsr_booking.gsr.gid)
 
             gsr_booking.is_cancelled = True
             gsr_booking.save()
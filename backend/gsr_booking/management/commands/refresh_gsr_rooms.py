@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from gsr_booking.api_wrapper import APIError, LibCalGSRBooker, PennGroupsGSRBooker
+from gsr_booking.models import GSR
+
+
+class Command(BaseCommand):
+    """
+    Refreshes the cached room ids of every LibCal and AGH GSR, so that availability
+    requests only need to ask LibCal for the rooms themselves
+    """
+
+    def handle(self, *args, **kwargs):
+        gsrs = GSR.objects.filter(kind__in=[GSR.KIND_LIBCAL, GSR.KIND_PENNGROUPS])
+        for gsr in gsrs:
+            booker = PennGroupsGSRBooker if gsr.kind == GSR.KIND_PENNGROUPS else LibCalGSRBooker
+            try:
+                room_ids = booker.refresh_room_ids(gsr.gid)
+            except (APIError, LookupError, ValueError) as e:
+                self.stderr.write(f"Failed to refresh rooms for {gsr.name}: {e}")
+                continue
+            self.stdout.write(f"Refreshed {len(room_ids)} rooms for {gsr.name}")
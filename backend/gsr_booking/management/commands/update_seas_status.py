@@ -38,7 +38,8 @@ class Command(BaseCommand):
             async with semaphore:
                 wrapper = PennGroupsBookingWrapper()
                 user = await asyncio.to_thread(get_user_model().objects.get, username=username)
-                is_seas = await asyncio.to_thread(wrapper.is_seas, user)
+                # also refreshes the PennGroups lookups cached for the user
+                is_seas = await asyncio.to_thread(wrapper.is_seas, user, refresh=True)
 
                 memberships = await asyncio.to_thread(
                     lambda: list(GroupMembership.objects.filter(user__username=username))
@@ -1,7 +1,14 @@
 from django.contrib import admin
 
-from laundry.models import LaundryRoom, LaundrySnapshot
+from laundry.models import (
+    LaundryMachineSubscription,
+    LaundryRoom,
+    LaundrySnapshot,
+    LaundryUsageRollup,
+)
 
 
 admin.site.register(LaundrySnapshot)
 admin.site.register(LaundryRoom)
+admin.site.register(LaundryUsageRollup)
+admin.site.register(LaundryMachineSubscription)
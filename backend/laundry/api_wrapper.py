@@ -1,33 +1,106 @@
 import datetime
+import hashlib
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, as_completed
 
-import requests
 from analytics.entries import FuncEntry
 from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncHour
 from django.utils import timezone
-from requests.exceptions import HTTPError
+from requests.exceptions import HTTPError, RequestException
 
-from laundry.models import LaundryRoom, LaundrySnapshot
+from laundry.models import LaundryRoom, LaundrySnapshot, LaundryUsageRollup
 from pennmobile.analytics import LabsAnalytics
+from utils import http
+from utils.cache import Cache, single_flight
+
+
+logger = logging.getLogger(__name__)
+
+# Number of rooms fetched at once by `all_status`
+MAX_WORKERS = 16
+# Seconds to wait on a single room before giving up on it
+ROOM_TIMEOUT = 10
+# Seconds to wait on a full sweep of every room before returning what we have
+SWEEP_TIMEOUT = 60
+# Seconds a room's machine status is shared between requests
+ROOM_STATUS_TTL = 5
+ROOM_STATUS_KEY = "laundry_room_status:{room_id}"
+# Seconds the machine details of past room status versions are kept for `since` polls
+ROOM_VERSION_TTL = Cache.HOUR
+ROOM_VERSION_KEY = "laundry_room_version:{room_id}:{version}"
+
+# Health of the laundry API, updated by every request made to it
+HEALTH_KEY = "laundry_health"
+# Weight of the latest request in the moving error rate
+HEALTH_SMOOTHING = 0.2
+# Seconds without any request to the laundry API before `check_is_working` probes it itself
+HEALTH_STALE_AFTER = 5 * 60
+# Failures in a row before the laundry API is reported as down
+MAX_CONSECUTIVE_FAILURES = 3
+
+# Shared keep-alive session so concurrent room fetches reuse connections
+session = http.get_session(settings.LAUNDRY_URL, pool_size=MAX_WORKERS)
 
 
 def get_room_url(room_id: int):
     return f"{settings.LAUNDRY_URL}/rooms/{room_id}/machines?raw=true"
 
 
-def get_validated(url):
+def get_validated(url, timeout=60):
     """
     Makes a request to the given URL and returns the JSON response if the request is successful.
     Uses headers specific to the laundry API and should not be used for other requests.
     @param url: The URL to make the request to.
+    @param timeout: Seconds to wait on the laundry API before raising a timeout.
     @return: The JSON response if the request is successful, otherwise None.
     """
     try:
-        request = requests.get(url, timeout=60, headers=settings.LAUNDRY_HEADERS)
+        request = session.get(url, timeout=timeout, headers=settings.LAUNDRY_HEADERS)
         request.raise_for_status()
-        return request.json()
+        data = request.json()
     except HTTPError as e:
         print(f"Error: {e}")
+        record_health(False)
         return None
+    except RequestException:
+        record_health(False)
+        raise
+    record_health(True)
+    return data
+
+
+def get_health():
+    return cache.get(HEALTH_KEY) or {
+        "last_checked": None,
+        "last_success": None,
+        "consecutive_failures": 0,
+        "error_rate": 0.0,
+    }
+
+
+def record_health(success):
+    """
+    Records the outcome of a request to the laundry API in the shared health state.
+    Concurrent updates may drop an outcome, which is fine for a moving average.
+    """
+
+    health = get_health()
+    now = timezone.now()
+    health["last_checked"] = now
+    if success:
+        health["last_success"] = now
+        health["consecutive_failures"] = 0
+    else:
+        health["consecutive_failures"] += 1
+    health["error_rate"] = round(
+        (1 - HEALTH_SMOOTHING) * health["error_rate"] + HEALTH_SMOOTHING * (not success), 3
+    )
+    cache.set(HEALTH_KEY, health, Cache.DAY)
 
 
 def update_machine_object(machine, machine_type_data):
@@ -63,7 +136,7 @@ def update_machine_object(machine, machine_type_data):
     return machine_type_data
 
 
-def parse_a_room(room_request_link):
+def parse_a_room(room_request_link, timeout=60):
     """
     Return names, hall numbers, and the washers/dryers available for a certain room_id
     """
@@ -87,9 +160,14 @@ def parse_a_room(room_request_link):
 
     detailed = []
 
-    request_json = get_validated(room_request_link)
+    request_json = get_validated(room_request_link, timeout=timeout)
     if request_json is None:
-        return {"washers": washers, "dryers": dryers, "details": detailed}
+        return {
+            "washers": washers,
+            "dryers": dryers,
+            "details": detailed,
+            "version": status_version(detailed),
+        }
     for machine in request_json:
         if machine["isWasher"]:
             update_machine_object(machine, washers)
@@ -126,16 +204,123 @@ def parse_a_room(room_request_link):
         if machine["isWasher"] or machine["isDryer"]
     ]
 
-    return {"washers": washers, "dryers": dryers, "details": detailed}
+    return {
+        "washers": washers,
+        "dryers": dryers,
+        "details": detailed,
+        "version": status_version(detailed),
+    }
+
+
+def status_version(details):
+    """
+    Return a short hash that changes whenever any machine in `details` changes
+    """
+
+    encoded = json.dumps(details, sort_keys=True, default=str).encode()
+    return hashlib.sha1(encoded).hexdigest()[:16]
+
+
+def version_keys(statuses):
+    """
+    Return the cache entries remembering the machine details of each version in
+    `statuses`, a dict of room_id -> machines
+    """
+
+    return {
+        ROOM_VERSION_KEY.format(room_id=room_id, version=machines["version"]): machines["details"]
+        for room_id, machines in statuses.items()
+    }
+
+
+def machines_since(room_id, machines, version):
+    """
+    Return `machines` with only the details that changed since `version`, along with the ids
+    of machines that were removed. Returns `machines` as is if `version` is unknown or expired.
+    """
+
+    previous = cache.get(ROOM_VERSION_KEY.format(room_id=room_id, version=version))
+    if previous is None:
+        return machines
+
+    previous = {machine["id"]: machine for machine in previous}
+    current_ids = {machine["id"] for machine in machines["details"]}
+    return {
+        **machines,
+        "details": [
+            machine for machine in machines["details"] if previous.get(machine["id"]) != machine
+        ],
+        "removed": [machine_id for machine_id in previous if machine_id not in current_ids],
+        "since": version,
+    }
 
 
 def check_is_working():
     """
     Returns True if the wash alert web interface seems to be working properly, or False otherwise.
+    Answers from the shared health state, and only probes a single room if nothing has
+    talked to the laundry API recently.
     """
 
-    all_rooms_request = get_validated(f"{settings.LAUNDRY_URL}/geoBoundaries/5610?raw=true")
-    return all_rooms_request is not None
+    health = get_health()
+    if (
+        health["last_checked"] is None
+        or (timezone.now() - health["last_checked"]).total_seconds() > HEALTH_STALE_AFTER
+    ) and cache.add(f"{HEALTH_KEY}:probe", True, ROOM_TIMEOUT):
+        room = LaundryRoom.objects.first()
+        url = (
+            get_room_url(room.room_id)
+            if room
+            else f"{settings.LAUNDRY_URL}/geoBoundaries/5610?raw=true"
+        )
+        try:
+            get_validated(url, timeout=ROOM_TIMEOUT)
+        except RequestException:
+            pass
+        health = get_health()
+
+    return health["consecutive_failures"] < MAX_CONSECUTIVE_FAILURES
+
+
+def fetch_rooms(rooms, timeout=ROOM_TIMEOUT, deadline=SWEEP_TIMEOUT):
+    """
+    Fetches the status of every given room in parallel and returns a dict of room -> status.
+    Rooms that error out or take longer than `timeout` seconds are left out, and if the whole
+    sweep takes longer than `deadline` seconds, only the rooms finished so far are returned.
+    """
+
+    statuses = {}
+    executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+    future_to_room = {
+        executor.submit(parse_a_room, get_room_url(room.room_id), timeout): room for room in rooms
+    }
+    try:
+        for future in as_completed(future_to_room, timeout=deadline):
+            room = future_to_room[future]
+            try:
+                statuses[room] = future.result()
+            except Exception:
+                # unreachable or malformed rooms shouldn't cost the rest of the sweep
+                logger.exception(f"Laundry: error fetching room {room.room_id}")
+    except TimeoutError:
+        logger.error(
+            f"Laundry: only fetched {len(statuses)} of {len(future_to_room)} rooms "
+            f"within {deadline} seconds"
+        )
+    finally:
+        # don't block on rooms that missed the deadline
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    # the sweep is as fresh as any room status request would be, so share it
+    cache.set_many(
+        {ROOM_STATUS_KEY.format(room_id=room.room_id): status for room, status in statuses.items()},
+        ROOM_STATUS_TTL,
+    )
+    cache.set_many(
+        version_keys({room.room_id: status for room, status in statuses.items()}),
+        ROOM_VERSION_TTL,
+    )
+    return statuses
 
 
 def all_status():
@@ -143,21 +328,78 @@ def all_status():
     Return names, hall numbers, and the washers/dryers available for all rooms in the system
     """
 
-    return {
-        room.name: parse_a_room(get_room_url(room.room_id)) for room in LaundryRoom.objects.all()
-    }
+    rooms = list(LaundryRoom.objects.all())
+    statuses = fetch_rooms(rooms)
+    return {room.name: statuses[room] for room in rooms if room in statuses}
 
 
-def room_status(room):
+def cached_room_machines(room_id):
     """
-    Return the status of each specific washer/dryer in a particular hall_id
+    Return the machines of a room from the shared room status cache, refreshing it from the
+    laundry API on a miss. Concurrent misses for the same room share a single upstream call.
     """
 
-    machines = parse_a_room(get_room_url(room.room_id))
+    def refresh():
+        machines = parse_a_room(get_room_url(room_id), timeout=ROOM_TIMEOUT)
+        cache.set_many(version_keys({room_id: machines}), ROOM_VERSION_TTL)
+        return machines
+
+    return single_flight(
+        ROOM_STATUS_KEY.format(room_id=room_id), refresh, ROOM_STATUS_TTL, lock_timeout=ROOM_TIMEOUT
+    )
+
+
+def get_machine(room_id, machine_id):
+    """
+    Return the details of a single machine from the room status cache, or None if not found
+    """
+
+    return next(
+        (
+            machine
+            for machine in cached_room_machines(room_id)["details"]
+            if str(machine["id"]) == str(machine_id)
+        ),
+        None,
+    )
+
+
+def machine_finishes_at(machine):
+    """
+    Return when a running machine finishes as an aware datetime, or None if it isn't running
+    """
+
+    finishes_at = machine["finishes_at"]
+    if finishes_at is None or timezone.is_aware(finishes_at):
+        return finishes_at
+    # the laundry API reports times in UTC without an offset
+    return timezone.make_aware(finishes_at, datetime.timezone.utc)
+
+
+def room_status(room, since=None):
+    """
+    Return the status of each specific washer/dryer in a particular hall_id.
+    If `since` is a previous version of the room status, only the machines that changed since
+    then are returned in `details`.
+    """
+
+    machines = cached_room_machines(room.room_id)
+    if since:
+        machines = machines_since(room.room_id, machines, since)
 
     return {"machines": machines, "hall_name": room.name, "location": room.location}
 
 
+def room_statuses(rooms, since=None):
+    """
+    Return the status of every given room, fetching rooms that are not cached in parallel.
+    `since` is an optional list of previous versions, one per room.
+    """
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        return list(executor.map(room_status, rooms, since or [None] * len(rooms)))
+
+
 def is_room_full(room_data: dict) -> bool:
     """
     Retruns whether a room is full or not meaning no washers or dryers are available
@@ -168,6 +410,86 @@ def is_room_full(room_data: dict) -> bool:
     )
 
 
+def sync_rooms(rows, delete_removed=False):
+    """
+    Brings the LaundryRooms in line with `rows` (dicts in the format of laundry_data.csv),
+    writing only the rooms that are new or changed in a single upsert. Rooms missing from
+    `rows` are only deleted if `delete_removed` is set, since that also deletes their history.
+    Returns the lists of added, changed and removed rooms.
+    """
+
+    fields = ["name", "location", "location_id", "total_washers", "total_dryers"]
+    existing = LaundryRoom.objects.in_bulk(field_name="room_id")
+    rooms = [
+        LaundryRoom(
+            room_id=int(row["room_id"]),
+            name=row["room_name"],
+            location=row["room_description"],
+            location_id=int(row["room_location"]),
+            total_washers=int(row["count_washers"]),
+            total_dryers=int(row["count_dryers"]),
+        )
+        for row in rows
+    ]
+
+    added = [room for room in rooms if room.room_id not in existing]
+    changed = [
+        room
+        for room in rooms
+        if room.room_id in existing
+        and any(getattr(room, field) != getattr(existing[room.room_id], field) for field in fields)
+    ]
+    room_ids = {room.room_id for room in rooms}
+    removed = [room for room_id, room in existing.items() if room_id not in room_ids]
+
+    LaundryRoom.objects.bulk_create(
+        added + changed,
+        update_conflicts=True,
+        update_fields=fields,
+        unique_fields=["room_id"],
+    )
+    if delete_removed:
+        LaundryRoom.objects.filter(id__in=[room.id for room in removed]).delete()
+
+    return added, changed, removed
+
+
+def rollup_snapshots(start, end):
+    """
+    Recomputes the hourly usage rollups from the LaundrySnapshots taken between `start`
+    (inclusive) and `end` (exclusive). Both should fall on the hour, so that every rollup
+    touched covers all of its snapshots. Returns the number of rollups written.
+    """
+
+    hours = (
+        LaundrySnapshot.objects.filter(date__gte=start, date__lt=end, room__isnull=False)
+        .annotate(hour=TruncHour("date"))
+        .values("room_id", "hour")
+        .annotate(
+            washers=Sum("available_washers"), dryers=Sum("available_dryers"), count=Count("id")
+        )
+        .order_by()
+    )
+    rollups = [
+        LaundryUsageRollup(
+            room_id=hour["room_id"],
+            date=hour["hour"].date(),
+            hour=hour["hour"].hour,
+            available_washers=hour["washers"],
+            available_dryers=hour["dryers"],
+            count=hour["count"],
+        )
+        for hour in hours
+    ]
+    LaundryUsageRollup.objects.bulk_create(
+        rollups,
+        update_conflicts=True,
+        update_fields=["available_washers", "available_dryers", "count"],
+        unique_fields=["room", "date", "hour"],
+    )
+    return len(rollups)
+
+
 @LabsAnalytics.record_function(
     FuncEntry(
         name="cron.full_laundry_room",
@@ -176,27 +498,46 @@ def is_room_full(room_data: dict) -> bool:
     FuncEntry(
         name="cron.full_laundry_rooms_list",
         get_value=lambda args, res: [
-            name for name, room_data in res.items() if is_room_full(room_data)
+            room_id for room_id, room_data in res.items() if is_room_full(room_data)
         ],
     ),
+    FuncEntry(name="cron.laundry_snapshots_saved", get_value=lambda args, res: len(res)),
+    FuncEntry(
+        name="cron.laundry_snapshot_seconds",
+        compute_before=time.monotonic,
+        get_value_use_before=lambda args, res, start: round(time.monotonic() - start, 3),
+    ),
 )
 def save_data():
     """
     Retrieves current laundry info and saves it into the database.
+    Returns the status of every room that was saved, keyed by room_id.
     """
 
     now = timezone.localtime()
 
-    if LaundrySnapshot.objects.filter(date=now).count() == 0:
-        data = all_status()
-
-        for name, room in data.items():
-            laundry_room = LaundryRoom.objects.get(name=name)
-
-            LaundrySnapshot.objects.create(
-                room=laundry_room,
-                date=now,
-                available_washers=room["washers"]["open"],
-                available_dryers=room["dryers"]["open"],
-            )
-        return data
+    if not LaundrySnapshot.objects.filter(date=now).exists():
+        start = time.monotonic()
+        rooms = list(LaundryRoom.objects.all())
+        statuses = fetch_rooms(rooms)
+
+        snapshots = LaundrySnapshot.objects.bulk_create(
+            [
+                LaundrySnapshot(
+                    room=room,
+                    date=now,
+                    available_washers=status["washers"]["open"],
+                    available_dryers=status["dryers"]["open"],
+                )
+                for room, status in statuses.items()
+            ]
+        )
+
+        hour = now.replace(minute=0, second=0, microsecond=0)
+        rollup_snapshots(hour, hour + datetime.timedelta(hours=1))
+
+        logger.info(
+            f"Laundry: saved {len(snapshots)} of {len(rooms)} room snapshots "
+            f"in {time.monotonic() - start:.2f} seconds"
+        )
+        return {room.room_id: status for room, status in statuses.items()}
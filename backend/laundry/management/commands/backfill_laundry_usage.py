@@ -0,0 +1,30 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from laundry.api_wrapper import rollup_snapshots
+from laundry.models import LaundrySnapshot
+
+
+class Command(BaseCommand):
+    help = "Builds the hourly laundry usage rollups from existing Laundry Snapshots."
+
+    def handle(self, *args, **kwargs):
+        bounds = LaundrySnapshot.objects.aggregate(first=Min("date"), last=Max("date"))
+        if bounds["first"] is None:
+            self.stdout.write("No snapshots to roll up!")
+            return
+
+        # one day at a time to keep each aggregation small
+        day = timezone.localtime(bounds["first"]).replace(hour=0, minute=0, second=0, microsecond=0)
+        count = 0
+        while day <= bounds["last"]:
+            next_day = timezone.make_aware(
+                datetime.datetime.combine(day.date() + datetime.timedelta(days=1), datetime.time())
+            )
+            count += rollup_snapshots(day, next_day)
+            day = next_day
+
+        self.stdout.write(f"Rolled up {count} hours of laundry usage!")
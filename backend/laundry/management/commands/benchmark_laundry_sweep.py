@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from laundry.api_wrapper import MAX_WORKERS, fetch_rooms
+from laundry.models import LaundryRoom
+from utils import http
+
+
+class Command(BaseCommand):
+    help = "Times sweeps of the laundry API over every Laundry room, without saving them."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--runs", type=int, default=3, help="Number of sweeps to time.")
+
+    def handle(self, *args, **kwargs):
+        rooms = list(LaundryRoom.objects.all())
+        for run in range(kwargs["runs"]):
+            start = time.monotonic()
+            statuses = fetch_rooms(rooms)
+            self.stdout.write(
+                f"Sweep {run + 1}: fetched {len(statuses)} of {len(rooms)} rooms "
+                f"with {MAX_WORKERS} workers in {time.monotonic() - start:.2f} seconds"
+            )
+        for host, stats in http.connection_stats().items():
+            self.stdout.write(
+                f"{host}: {stats['requests']} requests over {stats['connections']} connections"
+            )
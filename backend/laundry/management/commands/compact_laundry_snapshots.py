@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from laundry.models import LaundrySnapshot
+from utils.retention import HOURLY_DAYS, RAW_DAYS, compact_snapshots
+
+
+class Command(BaseCommand):
+    help = "Downsamples old Laundry Snapshots into hourly and daily averages."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--raw-days", type=int, default=RAW_DAYS, help="Days to keep every snapshot for."
+        )
+        parser.add_argument(
+            "--hourly-days",
+            type=int,
+            default=HOURLY_DAYS,
+            help="Days to keep hourly averages for before keeping daily averages.",
+        )
+
+    def handle(self, *args, **kwargs):
+        removed = compact_snapshots(
+            LaundrySnapshot,
+            ["available_washers", "available_dryers"],
+            raw_days=kwargs["raw_days"],
+            hourly_days=kwargs["hourly_days"],
+        )
+        self.stdout.write(f"Removed {removed} Laundry Snapshots!")
@@ -1,9 +1,10 @@
 import csv
+from concurrent.futures import ThreadPoolExecutor
 
 from django.conf import settings
 from django.core.management.base import BaseCommand
 
-from laundry.api_wrapper import get_validated
+from laundry.api_wrapper import MAX_WORKERS, ROOM_TIMEOUT, get_validated, sync_rooms
 
 
 def write_file(laundry_rooms):
@@ -13,8 +14,21 @@ def write_file(laundry_rooms):
         writer.writerows(laundry_rooms)
 
 
+def get_machines(room):
+    return get_validated(
+        f"{settings.LAUNDRY_URL}/rooms/{room['room_id']}/machines?raw=true", timeout=ROOM_TIMEOUT
+    )
+
+
 class Command(BaseCommand):
-    help = "Update laundry rooms csv from server"
+    help = "Update laundry rooms csv and database from server"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--delete-removed",
+            action="store_true",
+            help="Delete rooms (and their history) that are no longer on Penn's servers.",
+        )
 
     def handle(self, *args, **kwargs):
         # Pull initial request with everything
@@ -37,19 +51,24 @@ class Command(BaseCommand):
         ]
 
         # for each room, send a request to find number of washers and dryers
-        # TODO: This is really inefficient, but may require change in frontend code to update
-        for room in laundry_rooms:
-            room_request_json = get_validated(
-                f"{settings.LAUNDRY_URL}/rooms/{room['room_id']}/machines?raw=true"
-            )
-            if room_request_json is None:
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            all_machines = list(executor.map(get_machines, laundry_rooms))
+
+        for room, machines in zip(laundry_rooms, all_machines):
+            if machines is None:
                 return
             # count washers and dryers
-            room["count_washers"] = len(
-                [machine for machine in room_request_json if machine["isWasher"]]
-            )
-            room["count_dryers"] = len(
-                [machine for machine in room_request_json if machine["isDryer"]]
-            )
+            room["count_washers"] = len([machine for machine in machines if machine["isWasher"]])
+            room["count_dryers"] = len([machine for machine in machines if machine["isDryer"]])
 
         write_file(laundry_rooms)
+
+        added, changed, removed = sync_rooms(laundry_rooms, kwargs["delete_removed"])
+        for label, rooms in [("Added", added), ("Changed", changed), ("Removed", removed)]:
+            names = ", ".join(room.name for room in rooms)
+            self.stdout.write(f"{label} {len(rooms)} rooms" + (f": {names}" if rooms else ""))
+        if removed and not kwargs["delete_removed"]:
+            self.stdout.write(
+                "Removed rooms were kept in the database, "
+                "run with --delete-removed to delete them."
+            )
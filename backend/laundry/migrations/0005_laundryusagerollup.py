@@ -0,0 +1,42 @@
+# Generated by Django 5.0.2 on 2026-10-17 21:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("laundry", "0004_alter_laundryroom_room_id"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LaundryUsageRollup",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("hour", models.IntegerField()),
+                ("available_washers", models.IntegerField(default=0)),
+                ("available_dryers", models.IntegerField(default=0)),
+                ("count", models.IntegerField(default=0)),
+                (
+                    "room",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to="laundry.laundryroom"
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="laundryusagerollup",
+            constraint=models.UniqueConstraint(
+                fields=("room", "date", "hour"), name="unique_room_hour"
+            ),
+        ),
+    ]
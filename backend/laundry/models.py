@@ -1,7 +1,11 @@
+from django.contrib.auth import get_user_model
 from django.db import models
 from django.utils import timezone
 
 
+User = get_user_model()
+
+
 class LaundryRoom(models.Model):
     room_id = models.IntegerField(default=0, unique=True)
     name = models.CharField(max_length=255)
@@ -22,3 +26,46 @@ class LaundrySnapshot(models.Model):
 
     def __str__(self):
         return f"Room {self.room.name} | {self.date.date()}"
+
+
+class LaundryUsageRollup(models.Model):
+    """
+    Sums of LaundrySnapshots for a room over one local hour, kept up to date by `save_data`.
+    """
+
+    room = models.ForeignKey(LaundryRoom, on_delete=models.CASCADE)
+    date = models.DateField()
+    hour = models.IntegerField()
+    available_washers = models.IntegerField(default=0)
+    available_dryers = models.IntegerField(default=0)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["room", "date", "hour"], name="unique_room_hour")
+        ]
+
+    def __str__(self):
+        return f"Room {self.room.name} | {self.date} {self.hour}:00"
+
+
+class LaundryMachineSubscription(models.Model):
+    """
+    A user waiting on a push notification for when a running machine finishes its cycle
+    """
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    room = models.ForeignKey(LaundryRoom, on_delete=models.CASCADE)
+    machine_id = models.CharField(max_length=255)
+    finishes_at = models.DateTimeField()
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "room", "machine_id"], name="unique_machine_subscription"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} | Room {self.room.name} | Machine {self.machine_id}"
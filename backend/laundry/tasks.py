@@ -0,0 +1,79 @@
+import datetime
+import logging
+
+from celery import shared_task
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from requests.exceptions import RequestException
+
+from laundry.api_wrapper import get_machine, machine_finishes_at
+from laundry.models import LaundryMachineSubscription
+from user.notifications import send_push_notifications
+
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+NOTIFICATION_SERVICE = "LAUNDRY"
+# Give up on machines that are still running this long after the subscription was made
+MAX_SUBSCRIPTION_AGE = datetime.timedelta(hours=4)
+# How long to wait before checking again when a machine overruns its finish time
+RECHECK_DELAY = datetime.timedelta(minutes=1)
+
+
+def schedule_machine_check(subscription):
+    notify_machine_finished.apply_async(
+        (subscription.id, subscription.finishes_at.isoformat()), eta=subscription.finishes_at
+    )
+
+
+@shared_task(name="laundry.notify_machine_finished")
+def notify_machine_finished(subscription_id, finishes_at=None):
+    """
+    Runs when a subscribed machine is due to finish. Notifies the user if it has finished,
+    and otherwise checks again when the machine is next due.
+    `finishes_at` is the time the check was scheduled for, and checks that were superseded
+    by a later one do nothing.
+    """
+
+    subscription = (
+        LaundryMachineSubscription.objects.filter(id=subscription_id).select_related("room").first()
+    )
+    # unsubscribed, or already notified by an earlier check
+    if subscription is None:
+        return
+    if finishes_at is not None and (
+        datetime.datetime.fromisoformat(finishes_at) != subscription.finishes_at
+    ):
+        return
+
+    now = timezone.now()
+    expired = now >= subscription.created_at + MAX_SUBSCRIPTION_AGE
+    try:
+        machine = get_machine(subscription.room.room_id, subscription.machine_id)
+    except RequestException:
+        # the laundry API is unreachable, so check again shortly
+        logger.exception(f"Laundry: error checking subscription {subscription_id}")
+        if expired:
+            subscription.delete()
+        else:
+            subscription.finishes_at = now + RECHECK_DELAY
+            subscription.save()
+            schedule_machine_check(subscription)
+        return
+
+    if machine is not None and machine["status"] == "IN_USE" and not expired:
+        subscription.finishes_at = max(machine_finishes_at(machine), now + RECHECK_DELAY)
+        subscription.save()
+        schedule_machine_check(subscription)
+        return
+
+    if machine is not None and machine["status"] != "IN_USE":
+        send_push_notifications(
+            User.objects.filter(id=subscription.user_id),
+            NOTIFICATION_SERVICE,
+            "Laundry is done!",
+            f"Your {machine['type']} in {subscription.room.name} has finished.",
+        )
+    subscription.delete()
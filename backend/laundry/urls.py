@@ -1,18 +1,41 @@
 from django.urls import path
 from django.views.decorators.cache import cache_page
 
-from laundry.views import HallInfo, HallUsage, Ids, MultipleHallInfo, Preferences, Status
-from utils.cache import Cache
+from laundry.views import (
+    HallForecast,
+    HallInfo,
+    HallUsage,
+    Ids,
+    MachineSubscription,
+    MultipleHallInfo,
+    Preferences,
+    Status,
+)
+from utils.cache import Cache, conditional
 
 
 urlpatterns = [
-    path("hall/<room_id>/", cache_page(Cache.MINUTE)(HallInfo.as_view()), name="hall-info"),
+    path(
+        "hall/<room_id>/",
+        conditional(cache_page(Cache.MINUTE)(HallInfo.as_view())),
+        name="hall-info",
+    ),
     path("usage/<room_id>/", cache_page(Cache.MINUTE)(HallUsage.as_view()), name="hall-usage"),
+    path(
+        "forecast/<room_id>/",
+        cache_page(Cache.MINUTE)(HallForecast.as_view()),
+        name="hall-forecast",
+    ),
     path(
         "rooms/<room_ids>",
-        cache_page(Cache.MINUTE)(MultipleHallInfo.as_view()),
+        conditional(cache_page(Cache.MINUTE)(MultipleHallInfo.as_view())),
         name="multiple-hall-info",
     ),
+    path(
+        "hall/<room_id>/machines/<machine_id>/subscription/",
+        MachineSubscription.as_view(),
+        name="machine-subscription",
+    ),
     path("halls/ids/", cache_page(Cache.MONTH)(Ids.as_view()), name="hall-ids"),
     path("status/", Status.as_view(), name="status"),
     path("preferences/", Preferences.as_view(), name="preferences"),
@@ -1,19 +1,30 @@
 import calendar
 import datetime
+from collections import defaultdict
 
+import numpy as np
 from analytics.entries import FuncEntry
 from django.core.cache import cache
-from django.db.models import Q
+from django.db.models import Case, F, Max, Min, Q, Sum, When
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
-from requests.exceptions import HTTPError
+from requests.exceptions import RequestException
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from laundry.api_wrapper import check_is_working, room_status
-from laundry.models import LaundryRoom, LaundrySnapshot
+from laundry.api_wrapper import (
+    check_is_working,
+    get_machine,
+    machine_finishes_at,
+    room_status,
+    room_statuses,
+    status_version,
+)
+from laundry.models import LaundryMachineSubscription, LaundryRoom, LaundryUsageRollup
 from laundry.serializers import LaundryRoomSerializer
+from laundry.tasks import schedule_machine_check
 from pennmobile.analytics import LabsAnalytics
 from utils.cache import Cache
 
@@ -39,11 +50,16 @@ class HallInfo(APIView):
         )
     )
     def get(self, request, room_id):
+        room = get_object_or_404(LaundryRoom, room_id=room_id)
         try:
-            return Response(room_status(get_object_or_404(LaundryRoom, room_id=room_id)))
-        except HTTPError:
+            room_data = room_status(room, request.query_params.get("since"))
+        except RequestException:
             return Response({"error": "The laundry api is currently unavailable."}, status=503)
 
+        response = Response(room_data)
+        response["ETag"] = f'"{room_data["machines"]["version"]}"'
+        return response
+
 
 class MultipleHallInfo(APIView):
     """
@@ -51,15 +67,40 @@ class MultipleHallInfo(APIView):
     """
 
     def get(self, request, room_ids):
-        rooms = [int(x) for x in room_ids.split(",")]
-        output = {"rooms": []}
+        room_ids = [int(x) for x in room_ids.split(",")]
+        rooms = LaundryRoom.objects.in_bulk(room_ids, field_name="room_id")
+        if len(rooms) < len(set(room_ids)):
+            raise Http404("No LaundryRoom matches the given query.")
+        rooms = [rooms[room_id] for room_id in room_ids]
+
+        # optional previous versions of each room's status, in the same order as the rooms
+        since = request.query_params.get("since")
+        since = since.split(",") if since else None
+        if since and len(since) != len(rooms):
+            return Response({"error": "since must have one version per room."}, status=400)
+
+        try:
+            statuses = room_statuses(rooms, since)
+        except RequestException:
+            return Response({"error": "The laundry api is currently unavailable."}, status=503)
 
-        for room_id in rooms:
-            room_data = room_status(get_object_or_404(LaundryRoom, room_id=room_id))
-            room_data["id"] = room_id
-            room_data["usage_data"] = HallUsage.compute_usage(room_id)
+        usages = HallUsage.batch_usage(rooms)
+        output = {"rooms": []}
+        for room, room_data in zip(rooms, statuses):
+            room_data["id"] = room.room_id
+            room_data["usage_data"] = usages[room.room_id]
             output["rooms"].append(room_data)
-        return Response(output)
+
+        response = Response(output)
+        response["ETag"] = '"{}"'.format(
+            status_version(
+                [
+                    [room_data["machines"]["version"], room_data["usage_data"]]
+                    for room_data in output["rooms"]
+                ]
+            )
+        )
+        return response
 
 
 class HallUsage(APIView):
@@ -70,63 +111,50 @@ class HallUsage(APIView):
     def safe_division(a, b):
         return round(a / float(b), 3) if b > 0 else 0
 
-    def get_snapshot_info(room_id):
-        # filters for LaundrySnapshots within timeframe
-        room = get_object_or_404(LaundryRoom, room_id=room_id)
-
-        # get start time, which is now without the times
-        start = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+    def get_usage_info(rooms):
+        # filters for hourly usage rollups within timeframe
 
-        # adds all the LaundrySnapshots from the same weekday within the previous 28 days
-        filter = Q()
-        for week in range(4):
-            new_start = start - datetime.timedelta(weeks=week)
-            new_end = new_start + datetime.timedelta(hours=27)
-            filter |= Q(room=room, date__gt=new_start, date__lt=new_end)
+        # same weekday within the previous 28 days, plus the first 3 hours of the next day
+        today = timezone.localtime().date()
+        days = [today - datetime.timedelta(weeks=week) for week in range(4)]
+        next_days = [day + datetime.timedelta(days=1) for day in days]
 
-        snapshots = LaundrySnapshot.objects.filter(filter).order_by("-date")
-        return (room, snapshots)
-
-    def compute_usage(room_id):
-        try:
-            (room, snapshots) = HallUsage.get_snapshot_info(room_id)
-        except ValueError:
-            return Response({"error": "Invalid hall id passed to server."}, status=404)
+        # one row per room per hour of the day (0-26), summed over the 4 weeks
+        return (
+            LaundryUsageRollup.objects.filter(
+                Q(date__in=days) | Q(date__in=next_days, hour__lt=3), room__in=rooms
+            )
+            .annotate(slot=Case(When(date__in=days, then=F("hour")), default=F("hour") + 24))
+            .values("room_id", "slot")
+            .annotate(
+                washers=Sum("available_washers"),
+                dryers=Sum("available_dryers"),
+                count=Sum("count"),
+                first_date=Min("date"),
+                last_date=Max("date"),
+            )
+            .order_by()
+        )
 
+    def format_usage(room, usage):
         # [0]: available washers, [1]: available dryers, [2]: total number of LaundrySnapshots
         data = [(0, 0, 0)] * 27
 
         # used calculate the start and end dates
-        min_date = timezone.localtime()
-        max_date = timezone.localtime() - datetime.timedelta(days=30)
-
-        for snapshot in snapshots:
-            date = snapshot.date.astimezone()
-            min_date = min(min_date, date)
-            max_date = max(max_date, date)
-            hour = date.hour
-
-            # accounts for the 3 hours on the next day
-            if (
-                calendar.day_name[timezone.localtime().weekday()]
-                == calendar.day_name[(date - datetime.timedelta(days=1)).weekday()]
-            ):
-                hour = date.hour + 24
-
-            # adds total number of available washers and dryers
-            if hour < len(data):
-                data[hour] = (
-                    data[hour][0] + snapshot.available_washers,
-                    data[hour][1] + snapshot.available_dryers,
-                    data[hour][2] + 1,
-                )
+        min_date = timezone.localtime().date()
+        max_date = (timezone.localtime() - datetime.timedelta(days=30)).date()
+
+        for hour in usage:
+            min_date = min(min_date, hour["first_date"])
+            max_date = max(max_date, hour["last_date"])
+            data[hour["slot"]] = (hour["washers"], hour["dryers"], hour["count"])
 
         content = {
             "hall_name": room.name,
             "location": room.location,
             "day_of_week": calendar.day_name[timezone.localtime().weekday()],
-            "start_date": min_date.date(),
-            "end_date": max_date.date(),
+            "start_date": min_date,
+            "end_date": max_date,
             "washer_data": {
                 x: HallUsage.safe_division(data[x][0], data[x][2]) for x in range(len(data))
             },
@@ -139,10 +167,119 @@ class HallUsage(APIView):
 
         return content
 
+    def batch_usage(rooms):
+        """
+        Returns the usage of each of the given rooms, keyed by room_id, using a single query
+        """
+        usage = defaultdict(list)
+        for hour in HallUsage.get_usage_info(rooms):
+            usage[hour["room_id"]].append(hour)
+        return {room.room_id: HallUsage.format_usage(room, usage[room.id]) for room in rooms}
+
+    def compute_usage(room_id):
+        try:
+            room = get_object_or_404(LaundryRoom, room_id=room_id)
+        except ValueError:
+            return Response({"error": "Invalid hall id passed to server."}, status=404)
+
+        return HallUsage.batch_usage([room])[room.room_id]
+
     def get(self, request, room_id):
         return Response(HallUsage.compute_usage(room_id))
 
 
+class HallForecast(APIView):
+    """
+    GET: returns the expected number of available washers and dryers of a particular hall
+    for each of the next `hours` hours (default 12), with a confidence band
+    """
+
+    default_hours = 12
+    max_hours = 48
+    history_days = 365
+    # history from four weeks ago counts half as much as the latest history
+    half_life_days = 7 * 4
+    # how much the same hour on other weekdays counts relative to the same weekday
+    other_weekday_weight = 0.2
+    # z-score of the band, ~80% of observations for normally distributed availability
+    band_z = 1.28
+
+    def forecast(room, hours):
+        now = timezone.localtime()
+        today = now.date()
+        start = now.replace(minute=0, second=0, microsecond=0)
+        times = [timezone.localtime(start + datetime.timedelta(hours=h)) for h in range(hours)]
+
+        rows = LaundryUsageRollup.objects.filter(
+            room=room,
+            date__gte=today - datetime.timedelta(days=HallForecast.history_days),
+            count__gt=0,
+        ).values_list("date", "hour", "available_washers", "available_dryers", "count")
+        dates, hour, washers, dryers, count = (
+            np.array(column) for column in (zip(*rows) if rows else [[]] * 5)
+        )
+        dates = dates.astype("datetime64[D]")
+        age = (np.datetime64(today) - dates).astype(int)
+        # 1970-01-01 was a Thursday
+        weekday = (dates.astype(int) + 3) % 7
+        # mean availability within each hour, one column per machine type
+        samples = np.stack([washers, dryers], axis=1) / count.reshape(-1, 1)
+
+        # weights of every history hour (columns) for every forecast hour (rows)
+        target_hour = np.array([time.hour for time in times]).reshape(-1, 1)
+        target_weekday = np.array([time.weekday() for time in times]).reshape(-1, 1)
+        weights = (
+            (hour == target_hour)
+            * np.where(weekday == target_weekday, 1.0, HallForecast.other_weekday_weight)
+            * 0.5 ** (age / HallForecast.half_life_days)
+        )
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            total = weights.sum(axis=1, keepdims=True)
+            mean = weights @ samples / total
+            std = np.sqrt(np.maximum(weights @ samples**2 / total - mean**2, 0))
+        capacity = np.array([room.total_washers, room.total_dryers])
+        low = np.clip(mean - HallForecast.band_z * std, 0, capacity)
+        high = np.clip(mean + HallForecast.band_z * std, 0, capacity)
+
+        def band(i, j):
+            if np.isnan(mean[i, j]):
+                return None
+            return {
+                "expected": round(float(mean[i, j]), 3),
+                "low": round(float(low[i, j]), 3),
+                "high": round(float(high[i, j]), 3),
+            }
+
+        return {
+            "hall_name": room.name,
+            "location": room.location,
+            "total_number_of_washers": room.total_washers,
+            "total_number_of_dryers": room.total_dryers,
+            "forecast": [
+                {"time": time, "washers": band(i, 0), "dryers": band(i, 1)}
+                for i, time in enumerate(times)
+            ],
+        }
+
+    def get(self, request, room_id):
+        try:
+            room = get_object_or_404(LaundryRoom, room_id=room_id)
+        except ValueError:
+            return Response({"error": "Invalid hall id passed to server."}, status=404)
+
+        try:
+            hours = int(request.query_params.get("hours", self.default_hours))
+        except ValueError:
+            hours = 0
+        if not 0 < hours <= self.max_hours:
+            return Response(
+                {"error": f"hours must be an integer between 1 and {self.max_hours}."}, status=400
+            )
+
+        return Response(HallForecast.forecast(room, hours))
+
+
 class Preferences(APIView):
     """
     GET: returns list of a User's laundry preferences
@@ -187,6 +324,44 @@ class Preferences(APIView):
         return Response({"success": True, "error": None})
 
 
+class MachineSubscription(APIView):
+    """
+    POST: subscribes the user to a push notification for when a running machine finishes
+
+    DELETE: unsubscribes the user from a machine
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, room_id, machine_id):
+        room = get_object_or_404(LaundryRoom, room_id=room_id)
+        if (machine := get_machine(room.room_id, machine_id)) is None:
+            return Response({"error": "Machine not found."}, status=404)
+        if machine["status"] != "IN_USE":
+            return Response({"error": "Machine is not running."}, status=400)
+
+        finishes_at = machine_finishes_at(machine)
+        subscription, created = LaundryMachineSubscription.objects.get_or_create(
+            user=request.user,
+            room=room,
+            machine_id=str(machine_id),
+            defaults={"finishes_at": finishes_at},
+        )
+        # subscribing again only needs a new check if the machine is due at a different time
+        if created or subscription.finishes_at != finishes_at:
+            subscription.finishes_at = finishes_at
+            subscription.save()
+            schedule_machine_check(subscription)
+
+        return Response({"finishes_at": subscription.finishes_at}, status=201)
+
+    def delete(self, request, room_id, machine_id):
+        LaundryMachineSubscription.objects.filter(
+            user=request.user, room__room_id=room_id, machine_id=str(machine_id)
+        ).delete()
+        return Response({"success": True, "error": None})
+
+
 class Status(APIView):
     """
     GET: returns Response according to whether or not Penn Laundry API is working or not
@@ -1,11 +1,11 @@
-from datetime import timedelta
-from unittest.mock import patch
+import json
+from unittest.mock import call, patch
 
 from django.test import TestCase
 from django.utils import timezone
 
 from dining.api_wrapper import DiningAPIWrapper
-from dining.models import DiningMenu, Venue
+from dining.models import DiningItem, DiningMenu, DiningStation, Venue
 
 
 def _make_response(venue_id, date_str, dayparts):
@@ -62,41 +62,147 @@ class TestLoadMenus(TestCase):
         self.assertEqual(count_after_first, expected)
         self.assertEqual(count_after_second, expected)
 
-    def test_delete_duplicate_menus(self):
+    def test_reload_upserts_menus(self):
         """
-        `delete_duplicate_menus` should remove all but the most recently
-        created menu for duplicate menu groups on the same date.
+        Reloading a date should keep its menus and replace their stations.
         """
         venue = Venue.objects.create(venue_id=9001, name="Dup", image_url="http://x")
+        date = timezone.now().date()
+        dayparts = [
+            {
+                "starttime": "17:00",
+                "endtime": "20:00",
+                "label": "Dinner",
+                "stations": [{"label": "Grill", "items": []}],
+            },
+        ]
+
+        def fake_fetch(self, venue_id, d):
+            # the same daypart twice in one response
+            dayparts_copy = [dict(dp) for dp in dayparts + dayparts]
+            return (venue_id, _make_response(venue_id, date.isoformat(), dayparts_copy))
+
+        with patch.object(DiningAPIWrapper, "fetch_menu", new=fake_fetch):
+            DiningAPIWrapper().load_menus(date)
+            menu = DiningMenu.objects.get(venue=venue, date=date)
+            DiningAPIWrapper().load_menus(date)
 
+        self.assertEqual([menu.id], [m.id for m in DiningMenu.objects.filter(date=date)])
+        self.assertEqual(1, DiningStation.objects.filter(menu=menu).count())
+
+    def test_reload_skips_unchanged_menus(self):
+        """
+        Reloading a date should only rewrite the menus whose content changed, and delete
+        the menus that are no longer served.
+        """
+        venue = Venue.objects.create(venue_id=9002, name="Hill", image_url="http://x")
         date = timezone.now().date()
+        dayparts = [
+            {
+                "starttime": "08:00",
+                "endtime": "10:00",
+                "label": "Breakfast",
+                "stations": [{"label": "Grill", "items": []}],
+            },
+            {
+                "starttime": "17:00",
+                "endtime": "20:00",
+                "label": "Dinner",
+                "stations": [{"label": "Grill", "items": []}],
+            },
+        ]
 
-        start_time = timezone.now()
-        end_time = start_time + timedelta(hours=1)
-
-        # Create three duplicate menus (same venue, date, times, service).
-        menus = [
-            DiningMenu.objects.create(
-                venue=venue,
-                date=date,
-                start_time=start_time,
-                end_time=end_time,
-                service="Dinner",
+        def fake_fetch(self, venue_id, d):
+            dayparts_copy = [dict(dp) for dp in dayparts]
+            return (venue_id, _make_response(venue_id, date.isoformat(), dayparts_copy))
+
+        with patch.object(DiningAPIWrapper, "fetch_menu", new=fake_fetch):
+            self.assertEqual(4, DiningAPIWrapper().load_menus(date))
+            breakfast = DiningStation.objects.get(menu__service="Breakfast")
+            dinner = DiningStation.objects.get(menu__service="Dinner")
+
+            # nothing changed upstream
+            self.assertEqual(0, DiningAPIWrapper().load_menus(date))
+
+            # only dinner changed upstream
+            dayparts[1] = {**dayparts[1], "stations": [{"label": "Pizza", "items": []}]}
+            self.assertEqual(2, DiningAPIWrapper().load_menus(date))
+            self.assertEqual(breakfast, DiningStation.objects.get(menu__service="Breakfast"))
+            self.assertNotEqual(dinner, DiningStation.objects.get(menu__service="Dinner"))
+            self.assertEqual("Pizza", DiningStation.objects.get(menu__service="Dinner").name)
+
+            # breakfast is no longer served
+            dayparts.pop(0)
+            self.assertEqual(0, DiningAPIWrapper().load_menus(date))
+            self.assertEqual(
+                ["Dinner"], [menu.service for menu in DiningMenu.objects.filter(venue=venue)]
             )
-            for _ in range(3)
-        ]
 
-        # Confrim we created 3 menus
-        self.assertEqual(DiningMenu.objects.filter(venue=venue, date=date).count(), 3)
+    def test_load_menus_bulk(self):
+        """
+        `load_menus` should write every menu, station and station item in a fixed number
+        of queries, however many there are.
+        """
+        Venue.objects.create(venue_id=593, name="1920 Commons", image_url="http://x")
+        date = timezone.now().date()
+        with open("tests/dining/menu.json") as data:
+            response = json.load(data)
+        response["menus"]["days"][0]["date"] = date.isoformat()
+        dayparts = response["menus"]["days"][0]["cafes"]["593"]["dayparts"][0]
 
-        wrapper = DiningAPIWrapper()
-        deleted_count = wrapper.delete_duplicate_menus(date)
+        def fake_fetch(self, venue_id, d):
+            return (venue_id, response)
 
-        # Two should be deleted, one should remain
-        self.assertEqual(deleted_count, 2)
-        remaining = DiningMenu.objects.filter(venue=venue, date=date)
-        self.assertEqual(remaining.count(), 1)
+        with patch.object(DiningAPIWrapper, "fetch_menu", new=fake_fetch):
+            # venues, loaded menus, savepoint, items, menus, old stations, stations, loaded items,
+            # station items, savepoint release and 3 for the pre-rendered view
+            with self.assertNumQueries(13):
+                rows = DiningAPIWrapper().load_menus(date)
+
+        stations = DiningStation.objects.filter(menu__date=date)
+        self.assertEqual(len(dayparts), DiningMenu.objects.filter(date=date).count())
+        self.assertEqual(sum(len(daypart["stations"]) for daypart in dayparts), stations.count())
+        # stations only link the items that were loaded
+        self.assertEqual(
+            sum(
+                len(set(station["items"]) & set(response["menus"]["items"]))
+                for daypart in dayparts
+                for station in daypart["stations"]
+            ),
+            DiningStation.items.through.objects.count(),
+        )
+        self.assertEqual(
+            DiningItem.objects.count()
+            + DiningMenu.objects.count()
+            + stations.count()
+            + DiningStation.items.through.objects.count(),
+            rows,
+        )
+
+    def test_load_week(self):
+        """
+        `load_week` should rebuild the search index and the 7 day view once, after every
+        date is loaded, and only render each date's own view while loading it.
+        """
+        venue = Venue.objects.create(venue_id=9003, name="Hill", image_url="http://x")
+        start = timezone.now().date()
+        dayparts = [
+            {"starttime": "08:00", "endtime": "10:00", "label": "Breakfast", "stations": []}
+        ]
 
-        # The remaining menu should be the one with the highest id
-        kept_id = max(m.id for m in menus)
-        self.assertEqual(remaining.first().id, kept_id)
+        def fake_fetch(self, venue_id, d):
+            return (venue_id, _make_response(venue_id, d.isoformat(), [dict(dayparts[0])]))
+
+        with (
+            patch.object(DiningAPIWrapper, "fetch_menu", new=fake_fetch),
+            patch("dining.api_wrapper.build_search_index") as build_search_index,
+            patch("dining.api_wrapper.render_menu_view_cache") as render_menu_view_cache,
+        ):
+            rows = DiningAPIWrapper().load_week(start)
+
+        self.assertEqual(7, len(rows))
+        self.assertEqual(7, DiningMenu.objects.filter(venue=venue).count())
+        build_search_index.assert_called_once()
+        self.assertEqual(
+            [call(date) for date in rows] + [call(None)], render_menu_view_cache.call_args_list
+        )
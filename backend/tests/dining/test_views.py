@@ -1,19 +1,24 @@
-import datetime
 import json
+from io import StringIO
 from unittest import mock
 
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.core.management import call_command
 from django.test import TestCase
 from django.test.utils import override_settings
 from django.urls import reverse
 from django.utils import timezone
 from requests.exceptions import ConnectionError
-from rest_framework.test import APIClient
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
 
-from dining.api_wrapper import APIError, DiningAPIWrapper
-from dining.models import DiningMenu, Venue
-from dining.utils.menu_view_cache import get_menu_view_cache
+from dining.api_wrapper import DINING_TOKEN_KEY, APIError, DiningAPIWrapper
+from dining.models import ALLERGENS, DIETS, DiningMenu, DiningStation, Venue, to_flags, to_mask
+from dining.serializers import DiningMenuSerializer
+from dining.utils.menu_view_cache import get_menu_view_cache, latest_menus, set_menu_view_cache
+from dining.views import Menus
 
 
 User = get_user_model()
@@ -58,41 +63,46 @@ def mock_request_post_error(*args, **kwargs):
     return Mock()
 
 
+@override_settings(
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+)
 class TestTokenAndRequest(TestCase):
     def setUp(self):
         self.wrapper = DiningAPIWrapper()
+        cache.clear()
 
-    def test_expired_token(self):
-        self.wrapper.expiration += datetime.timedelta(days=1)
-        prev_token = self.wrapper.token
-        prev_expiration = self.wrapper.expiration
-
-        self.wrapper.update_token()
+    def test_shared_token(self):
+        with mock.patch("utils.http.post", side_effect=mock_dining_requests) as mock_post:
+            self.assertEqual("access token", self.wrapper.get_token())
+            # other clients, like other threads and processes, reuse the token
+            self.assertEqual("access token", DiningAPIWrapper().get_token())
+        self.assertEqual(1, mock_post.call_count)
 
-        # assert that nothing has changed
-        self.assertEqual(prev_token, self.wrapper.token)
-        self.assertEqual(prev_expiration, self.wrapper.expiration)
-
-    @mock.patch("requests.post", mock_request_post_error)
+    @mock.patch("utils.http.post", mock_request_post_error)
     def test_update_token_error(self):
         with self.assertRaises(APIError):
-            self.wrapper.update_token()
+            self.wrapper.get_token()
+        self.assertIsNone(cache.get(DINING_TOKEN_KEY))
 
-    @mock.patch("requests.post", mock_dining_requests)
-    @mock.patch("requests.request", lambda **kwargs: None)
+    @mock.patch("utils.http.post", mock_dining_requests)
+    @mock.patch("utils.http.request", lambda **kwargs: None)
     def test_request_headers_update(self):
         res = self.wrapper.request(headers=dict())
         self.assertIsNone(res)
 
-    @mock.patch("requests.post", mock_dining_requests)
-    @mock.patch("requests.request", mock_request_raise_error)
+    @mock.patch("utils.http.post", mock_dining_requests)
+    @mock.patch("utils.http.request", mock_request_raise_error)
     def test_request_api_error(self):
         with self.assertRaises(APIError):
             self.wrapper.request()
 
 
-@mock.patch("requests.post", mock_dining_requests)
-@mock.patch("requests.request", mock_dining_requests)
+@mock.patch("utils.http.post", mock_dining_requests)
+@mock.patch("utils.http.request", mock_dining_requests)
 class TestVenues(TestCase):
     def setUp(self):
         call_command("load_venues")
@@ -109,10 +119,48 @@ class TestVenues(TestCase):
                 self.assertIn("dayparts", day)
         self.assertEqual(15, len(response.json()))
 
+    def test_get_venues_queries(self):
+        # one lookup for the metadata of every venue
+        with self.assertNumQueries(1):
+            DiningAPIWrapper().get_venues()
+
+
+@override_settings(
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+)
+class TestVenuesCache(TestCase):
+    def setUp(self):
+        call_command("load_venues")
+        cache.clear()
+
+    @mock.patch("utils.http.post", mock_dining_requests)
+    @mock.patch("utils.http.request", mock_dining_requests)
+    def test_refresh_venues(self):
+        out = StringIO()
+        call_command("refresh_venues", stdout=out)
+        self.assertEqual("Refreshed 15 Dining Venues!\n", out.getvalue())
+
+        # served from the cache without calling the API
+        with mock.patch("utils.http.request", mock_request_raise_error):
+            response = self.client.get(reverse("venues"))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(15, len(response.json()))
+
+    @mock.patch("utils.http.post", mock_dining_requests)
+    def test_cache_miss(self):
+        with mock.patch("utils.http.request", side_effect=mock_dining_requests) as mock_request:
+            self.client.get(reverse("venues"))
+            self.client.get(reverse("venues"))
+        self.assertEqual(1, mock_request.call_count)
+
 
 class TestMenus(TestCase):
-    @mock.patch("requests.post", mock_dining_requests)
-    @mock.patch("requests.request", mock_dining_requests)
+    @mock.patch("utils.http.post", mock_dining_requests)
+    @mock.patch("utils.http.request", mock_dining_requests)
     def setUp(self):
         Venue.objects.create(
             venue_id=593,
@@ -148,7 +196,86 @@ class TestMenus(TestCase):
         response = self.client.get("/dining/menus/" + str(timezone.now().date()) + "/")
         self.try_structure(response.json())
 
-    @mock.patch("requests.request", mock_dining_requests)
+    def test_get_queries(self):
+        # menus with their venues, stations and items, however many menus there are
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse("menus"))
+        self.assertTrue(response.json())
+        self.assertTrue(any(station["items"] for station in response.json()[0]["stations"]))
+
+    def get_items(self, params):
+        response = self.client.get(reverse("menus"), params)
+        self.try_structure(response.json())
+        return [
+            item
+            for menu in response.json()
+            for station in menu["stations"]
+            for item in station["items"]
+        ]
+
+    def test_filter_diet(self):
+        items = self.get_items({"diet": "vegan"})
+        self.assertTrue(items)
+        for item in items:
+            self.assertIn("Vegan", item["allergens"].split(", "))
+
+    def test_filter_exclude(self):
+        all_items = self.get_items({})
+        items = self.get_items({"exclude": "egg,milk", "diet": "vegetarian"})
+        self.assertTrue(items)
+        self.assertLess(len(items), len(all_items))
+        for item in items:
+            allergens = item["allergens"].split(", ")
+            self.assertNotIn("Egg", allergens)
+            self.assertNotIn("Milk", allergens)
+            self.assertIn("Vegetarian", allergens)
+
+    def test_filter_queries(self):
+        with self.assertNumQueries(3):
+            self.client.get(reverse("menus"), {"exclude": "peanut"})
+
+    def test_filter_unknown(self):
+        response = self.client.get(reverse("menus"), {"exclude": "peanut,bacon"})
+        self.assertEqual(400, response.status_code)
+        self.assertIn("bacon", response.json()["error"])
+
+    def test_get_queryset(self):
+        # the queryset can be built without going through get, e.g. by schema generation
+        view = Menus(kwargs={}, request=Request(APIRequestFactory().get("/", {"diet": "vegan"})))
+        self.assertTrue(view.get_queryset())
+
+    def test_flag_bits(self):
+        # every flag keeps its own bit, wherever it is listed
+        for flags in [ALLERGENS, DIETS]:
+            bits = [bit for bit, _ in flags.values()]
+            self.assertEqual(len(bits), len(set(bits)))
+        self.assertEqual(0b1000001, to_flags({"Peanut", "Milk", "Vegan"}, ALLERGENS))
+        self.assertEqual(0b1000001, to_mask(["milk", "peanut"], ALLERGENS))
+
+    def test_search(self):
+        item = DiningStation.objects.filter(menu__date=timezone.now().date()).first().items.first()
+        response = self.client.get(reverse("dining-search"), {"q": item.name.upper()})
+        self.assertEqual(200, response.status_code)
+        hit = response.json()[0]
+        self.assertEqual(item.item_id, hit["item_id"])
+        self.assertEqual(
+            {"venue_id", "venue", "date", "service", "station"}, set(hit["servings"][0])
+        )
+        self.assertEqual(593, hit["servings"][0]["venue_id"])
+
+        # prefixes of every word have to match
+        query = " ".join(word[:3] for word in item.name.split())
+        self.assertIn(
+            item.item_id,
+            [
+                hit["item_id"]
+                for hit in self.client.get(reverse("dining-search"), {"q": query}).json()
+            ],
+        )
+        self.assertEqual([], self.client.get(reverse("dining-search"), {"q": "zzzz"}).json())
+        self.assertEqual(400, self.client.get(reverse("dining-search")).status_code)
+
+    @mock.patch("utils.http.request", mock_dining_requests)
     def test_skip_venue(self):
         Venue.objects.all().delete()
         Venue.objects.create(venue_id=747, name="Skip", image_url="URL")
@@ -165,15 +292,48 @@ class TestMenus(TestCase):
     }
 )
 class TestMenuViewCache(TestCase):
-    @mock.patch("requests.post", mock_dining_requests)
-    @mock.patch("requests.request", mock_dining_requests)
-    def test_cache_cleared_on_load_next_menu(self):
+    def test_lazy_render_does_not_replace(self):
+        cache.clear()
+        today = str(timezone.now().date())
+        # a view fills an empty slot
+        set_menu_view_cache(today, [], replace=False)
+        self.assertEqual(b"[]", get_menu_view_cache(today))
+
+        # but never replaces the menus cached by load_menus, which may be newer
+        set_menu_view_cache(today, [{"service": "Dinner"}])
+        set_menu_view_cache(today, [], replace=False)
+        self.assertEqual([{"service": "Dinner"}], json.loads(get_menu_view_cache(today)))
+
+    @mock.patch("utils.http.post", mock_dining_requests)
+    @mock.patch("utils.http.request", mock_dining_requests)
+    def test_cache_rendered_on_load_next_menu(self):
+        today = str(timezone.now().date())
         call_command("load_next_menu")
-        response = self.client.get(reverse("menus-with-date", args=[str(timezone.now().date())]))
+        self.assertIsNotNone(get_menu_view_cache(today))
+        self.assertIsNotNone(get_menu_view_cache(None))
+
+        # served from the pre-rendered payload without touching the database
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("menus-with-date", args=[today]))
+            week_response = self.client.get(reverse("menus"))
         self.assertEqual(response.status_code, 200)
-        self.assertIsNotNone(get_menu_view_cache(str(timezone.now().date())))
+        self.assertEqual(response.json(), week_response.json())
+        self.assertEqual(
+            response.json(),
+            json.loads(
+                JSONRenderer().render(DiningMenuSerializer(latest_menus(today), many=True).data)
+            ),
+        )
+
+        # a reload swaps in its own menus
         call_command("load_next_menu")
-        self.assertIsNone(get_menu_view_cache(str(timezone.now().date())))
+        self.assertEqual(
+            [menu.id for menu in latest_menus(today)],
+            [
+                menu["id"]
+                for menu in self.client.get(reverse("menus-with-date", args=[today])).json()
+            ],
+        )
 
 
 class TestPreferences(TestCase):
@@ -1,15 +1,24 @@
 import json
 from datetime import timedelta
+from io import StringIO
 from unittest import mock
 
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.core.management import call_command
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.utils import timezone
 from requests.exceptions import ConnectTimeout
 from rest_framework.test import APIClient
 
-from gsr_booking.api_wrapper import APIError, GSRBooker, WhartonGSRBooker
+from gsr_booking.api_wrapper import (
+    APIError,
+    GSRBooker,
+    LibCalBookingWrapper,
+    PennGroupsBookingWrapper,
+    PennGroupsGSRBooker,
+    WhartonGSRBooker,
+)
 from gsr_booking.models import GSR, Group, GroupMembership, GSRBooking, Reservation
 
 
@@ -228,6 +237,63 @@ class TestBookingWrapper(TestCase):
         self.assertIn("id", availability["rooms"][0])
         self.assertIn("availability", availability["rooms"][0])
 
+    @override_settings(
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+    )
+    @mock.patch("gsr_booking.models.PennGroupsGSRBooker.is_seas", return_value=False)
+    @mock.patch("gsr_booking.models.WhartonGSRBooker.is_wharton", return_value=False)
+    def test_libcal_availability_shared(self, mock_is_seas, mock_is_wharton):
+        cache.clear()
+        with mock.patch(
+            "gsr_booking.api_wrapper.LibCalBookingWrapper.request",
+            side_effect=lambda *args, **kwargs: mock_requests_get(None, *args, **kwargs),
+        ) as mock_request:
+            availability = GSRBooker.get_availability(
+                "1086", 1889, "2021-01-07", "2022-01-08", self.user
+            )
+            # every user shares the same cached availability
+            self.assertEqual(
+                availability,
+                GSRBooker.get_availability(
+                    "1086", 1889, "2021-01-07", "2022-01-08", self.group_user
+                ),
+            )
+            self.assertEqual(2, mock_request.call_count)
+
+            # booking through us invalidates it
+            GSRBooker.book_room(
+                1889,
+                7192,
+                "VP WIC Booth 01",
+                "2021-12-05T16:00:00-05:00",
+                "2021-12-05T16:30:00-05:00",
+                self.user,
+            )
+            GSRBooker.get_availability("1086", 1889, "2021-01-07", "2022-01-08", self.user)
+            # the rooms in the building are still cached
+            self.assertEqual(4, mock_request.call_count)
+
+    @override_settings(
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+    )
+    @mock.patch("gsr_booking.models.PennGroupsGSRBooker.is_seas", return_value=False)
+    @mock.patch("gsr_booking.models.WhartonGSRBooker.is_wharton", return_value=False)
+    @mock.patch("gsr_booking.api_wrapper.PennGroupsBookingWrapper.request", mock_agh_libcal_request)
+    def test_refresh_gsr_rooms(self, mock_is_seas, mock_is_wharton):
+        cache.clear()
+        with mock.patch(
+            "gsr_booking.api_wrapper.LibCalBookingWrapper.request",
+            side_effect=lambda *args, **kwargs: mock_requests_get(None, *args, **kwargs),
+        ) as mock_request:
+            call_command("refresh_gsr_rooms", stdout=StringIO())
+            refreshes = mock_request.call_count
+            self.assertEqual(GSR.objects.filter(kind=GSR.KIND_LIBCAL).count(), refreshes)
+
+            # availability goes straight to the rooms
+            GSRBooker.get_availability("1086", 1889, "2021-01-07", "2022-01-08", self.user)
+            self.assertEqual(refreshes + 1, mock_request.call_count)
+            self.assertIn("space/item", mock_request.call_args.args[1])
+
     @mock.patch("gsr_booking.models.PennGroupsGSRBooker.is_seas", return_value=False)
     @mock.patch("gsr_booking.models.WhartonGSRBooker.is_wharton", return_value=False)
     @mock.patch("gsr_booking.api_wrapper.LibCalBookingWrapper.request", mock_requests_get)
@@ -370,9 +436,34 @@ class TestBookingWrapper(TestCase):
         self.assertIn("id", availability["rooms"][0])
         self.assertIn("availability", availability["rooms"][0])
 
+    @override_settings(
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+    )
+    @mock.patch("gsr_booking.models.WhartonGSRBooker.is_wharton", return_value=False)
+    def test_authorized_rooms_cached(self, mock_is_wharton):
+        cache.clear()
+        seas_user = User.objects.create_user("seas_user", "seas_user@seas.upenn.edu", "pass")
+        non_seas_user = User.objects.create_user("not_seas_user", "user@sas.upenn.edu", "pass")
+
+        with mock.patch("utils.http.get", side_effect=mock_penngroups_api_get) as mock_get:
+            rooms = PennGroupsGSRBooker.get_authorized_rooms(seas_user)
+            self.assertTrue(PennGroupsGSRBooker.is_seas(seas_user))
+            self.assertEqual(rooms, PennGroupsGSRBooker.get_authorized_rooms(seas_user))
+            self.assertEqual(1, mock_get.call_count)
+
+            # as done by update_seas_status
+            self.assertTrue(PennGroupsGSRBooker.is_seas(seas_user, refresh=True))
+            self.assertEqual(2, mock_get.call_count)
+
+        # SUBJECT_NOT_FOUND is cached too
+        with mock.patch("utils.http.get", side_effect=mock_non_seas_get) as mock_get:
+            self.assertFalse(PennGroupsGSRBooker.is_seas(non_seas_user))
+            self.assertFalse(PennGroupsGSRBooker.is_seas(non_seas_user))
+            self.assertEqual(1, mock_get.call_count)
+
     @mock.patch("gsr_booking.models.WhartonGSRBooker.is_wharton", return_value=False)
     @mock.patch("gsr_booking.api_wrapper.PennGroupsBookingWrapper.request", mock_agh_libcal_request)
-    @mock.patch("requests.get", mock_penngroups_api_get)
+    @mock.patch("utils.http.get", mock_penngroups_api_get)
     def test_is_seas(self, mock_is_wharton):
         """Test SEAS status checking via PennGroups API"""
         from gsr_booking.api_wrapper import PennGroupsGSRBooker
@@ -404,13 +495,13 @@ class TestBookingWrapper(TestCase):
                     return MockResponse(json.load(f))
             return MockResponse({})
 
-        with mock.patch("requests.get", mock_non_seas_get_local):
+        with mock.patch("utils.http.get", mock_non_seas_get_local):
             is_seas_result = PennGroupsGSRBooker.is_seas(non_seas_user)
             self.assertFalse(is_seas_result)
 
     @mock.patch("gsr_booking.models.WhartonGSRBooker.is_wharton", return_value=False)
     @mock.patch("gsr_booking.api_wrapper.PennGroupsBookingWrapper.request", mock_agh_libcal_request)
-    @mock.patch("requests.get", mock_penngroups_api_get)
+    @mock.patch("utils.http.get", mock_penngroups_api_get)
     @mock.patch("gsr_booking.models.PennGroupsGSRBooker.is_seas", return_value=True)
     def test_groupmembership_auto_sets_is_seas(self, mock_model_is_seas, mock_is_wharton):
         """Test that GroupMembership automatically sets is_seas when created"""
@@ -439,7 +530,7 @@ class TestBookingWrapper(TestCase):
 
     @mock.patch("gsr_booking.models.WhartonGSRBooker.is_wharton", return_value=False)
     @mock.patch("gsr_booking.api_wrapper.PennGroupsBookingWrapper.request", mock_agh_libcal_request)
-    @mock.patch("requests.get", mock_non_seas_get)
+    @mock.patch("utils.http.get", mock_non_seas_get)
     @mock.patch("gsr_booking.models.PennGroupsGSRBooker.is_seas", return_value=False)
     def test_groupmembership_auto_sets_is_seas_false(self, mock_model_is_seas, mock_is_wharton):
         """Test that GroupMembership automatically sets is_seas=False for non-SEAS users"""
@@ -468,7 +559,7 @@ class TestBookingWrapper(TestCase):
 
     @mock.patch("gsr_booking.models.PennGroupsGSRBooker.is_seas", return_value=True)
     @mock.patch("gsr_booking.models.WhartonGSRBooker.is_wharton", return_value=False)
-    @mock.patch("requests.get", mock_penngroups_api_get)
+    @mock.patch("utils.http.get", mock_penngroups_api_get)
     @mock.patch("gsr_booking.api_wrapper.PennGroupsBookingWrapper.request", mock_agh_libcal_request)
     def test_penngroups_availability(self, mock_is_seas, mock_is_wharton):
         """Test AGH room availability for SEAS students"""
@@ -495,7 +586,7 @@ class TestBookingWrapper(TestCase):
 
     @mock.patch("gsr_booking.models.PennGroupsGSRBooker.is_seas", return_value=True)
     @mock.patch("gsr_booking.models.WhartonGSRBooker.is_wharton", return_value=False)
-    @mock.patch("requests.get", mock_penngroups_api_get)
+    @mock.patch("utils.http.get", mock_penngroups_api_get)
     @mock.patch("gsr_booking.api_wrapper.PennGroupsBookingWrapper.request", mock_agh_libcal_request)
     def test_book_penngroups(self, mock_is_seas, mock_is_wharton):
         """Test booking an AGH room"""
@@ -546,7 +637,7 @@ class TestBookingWrapper(TestCase):
         self.assertIsNone(cancel)
 
     @mock.patch("gsr_booking.models.WhartonGSRBooker.is_wharton", return_value=False)
-    @mock.patch("requests.get", mock_penngroups_api_get)
+    @mock.patch("utils.http.get", mock_penngroups_api_get)
     @mock.patch("gsr_booking.api_wrapper.PennGroupsBookingWrapper.request", mock_agh_libcal_request)
     @mock.patch("gsr_booking.models.PennGroupsGSRBooker.is_seas", return_value=True)
     def test_group_book_penngroups(self, mock_model_is_seas, mock_is_wharton):
@@ -595,7 +686,7 @@ class TestBookingWrapper(TestCase):
 
     @mock.patch("gsr_booking.models.PennGroupsGSRBooker.is_seas", return_value=False)
     @mock.patch("gsr_booking.models.WhartonGSRBooker.is_wharton", return_value=False)
-    @mock.patch("requests.get", mock_non_seas_get)
+    @mock.patch("utils.http.get", mock_non_seas_get)
     @mock.patch("gsr_booking.api_wrapper.PennGroupsBookingWrapper.request", mock_agh_libcal_request)
     def test_non_seas_availability(self, mock_is_seas, mock_is_wharton):
         """Test that non-SEAS users get empty availability"""
@@ -610,7 +701,7 @@ class TestBookingWrapper(TestCase):
 
     @mock.patch("gsr_booking.models.PennGroupsGSRBooker.is_seas", return_value=False)
     @mock.patch("gsr_booking.models.WhartonGSRBooker.is_wharton", return_value=False)
-    @mock.patch("requests.get", mock_non_seas_get)
+    @mock.patch("utils.http.get", mock_non_seas_get)
     @mock.patch("gsr_booking.api_wrapper.PennGroupsBookingWrapper.request", mock_agh_libcal_request)
     def test_non_seas_book_fails(self, mock_is_seas, mock_is_wharton):
         """Test that non-SEAS users cannot book AGH rooms"""
@@ -630,7 +721,7 @@ class TestBookingWrapper(TestCase):
 
     @mock.patch("gsr_booking.models.PennGroupsGSRBooker.is_seas", return_value=True)
     @mock.patch("gsr_booking.models.WhartonGSRBooker.is_wharton", return_value=False)
-    @mock.patch("requests.get", mock_penngroups_api_get)
+    @mock.patch("utils.http.get", mock_penngroups_api_get)
     @mock.patch("gsr_booking.api_wrapper.PennGroupsBookingWrapper.request")
     def test_unauthorized_room_booking_fails(self, mock_request, mock_is_seas, mock_is_wharton):
         """Test that users cannot book rooms they're not authorized for"""
@@ -691,7 +782,7 @@ class TestBookingWrapper(TestCase):
         self.assertIn("authorized", str(context.exception).lower())
 
     @mock.patch("gsr_booking.models.WhartonGSRBooker.is_wharton", return_value=False)
-    @mock.patch("requests.get", mock_penngroups_api_get)
+    @mock.patch("utils.http.get", mock_penngroups_api_get)
     @mock.patch("gsr_booking.api_wrapper.PennGroupsBookingWrapper.request", mock_agh_libcal_request)
     @mock.patch("gsr_booking.models.PennGroupsGSRBooker.is_seas", return_value=True)
     def test_group_penngroups_availability(self, mock_model_is_seas, mock_is_wharton):
@@ -721,7 +812,7 @@ class TestBookingWrapper(TestCase):
         self.assertIn("AGH 334", room_names)
 
     @mock.patch("gsr_booking.models.WhartonGSRBooker.is_wharton", return_value=False)
-    @mock.patch("requests.get", mock_non_seas_get)
+    @mock.patch("utils.http.get", mock_non_seas_get)
     @mock.patch("gsr_booking.api_wrapper.PennGroupsBookingWrapper.request", mock_agh_libcal_request)
     @mock.patch("gsr_booking.models.PennGroupsGSRBooker.is_seas", return_value=False)
     def test_group_penngroups_availability_no_seas_members(
@@ -784,7 +875,7 @@ class TestBookingWrapper(TestCase):
         self.assertFalse(PennGroupsGSRBooker.is_room_authorized("", authorized_extensions))
 
     @mock.patch("gsr_booking.models.WhartonGSRBooker.is_wharton", return_value=False)
-    @mock.patch("requests.get")
+    @mock.patch("utils.http.get")
     def test_get_authorized_rooms_api_errors(self, mock_get, mock_is_wharton):
         """Test error handling in get_authorized_rooms"""
         from gsr_booking.api_wrapper import PennGroupsGSRBooker
@@ -850,7 +941,7 @@ class TestBookingWrapper(TestCase):
         self.assertTrue(cancelled_booking.is_cancelled)
 
     @mock.patch("gsr_booking.models.WhartonGSRBooker.is_wharton", return_value=False)
-    @mock.patch("requests.get", mock_penngroups_api_get)
+    @mock.patch("utils.http.get", mock_penngroups_api_get)
     @mock.patch("gsr_booking.api_wrapper.PennGroupsBookingWrapper.request", mock_agh_libcal_request)
     @mock.patch("gsr_booking.models.PennGroupsGSRBooker.is_seas", return_value=True)
     def test_group_book_penngroups_credit_distribution(self, mock_model_is_seas, mock_is_wharton):
@@ -893,3 +984,32 @@ class TestBookingWrapper(TestCase):
         # Verify total time matches requested duration
         total_time = sum([booking.end - booking.start for booking in bookings], timedelta())
         self.assertEqual(total_time, timedelta(hours=2))
+
+
+def mock_token_post(url, body):
+    class MockResponse:
+        status_code = 200
+
+        def json(self):
+            return {"access_token": f"token for {body['client_id']}", "expires_in": 3600}
+
+    return MockResponse()
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    GENERAL_LIBCAL_ID="libcal",
+    AGH_LIBCAL_ID="agh",
+)
+class TestLibCalTokens(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_shared_tokens(self):
+        with mock.patch("utils.http.post", side_effect=mock_token_post) as mock_post:
+            self.assertEqual("token for libcal", LibCalBookingWrapper().get_token())
+            self.assertEqual("token for agh", PennGroupsBookingWrapper().get_token())
+            # other clients, like other threads and processes, reuse the tokens
+            self.assertEqual("token for libcal", LibCalBookingWrapper().get_token())
+            self.assertEqual("token for agh", PennGroupsBookingWrapper().get_token())
+        self.assertEqual(2, mock_post.call_count)
@@ -1,9 +1,19 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from unittest import mock
 
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
-from laundry.api_wrapper import all_status, room_status, save_data
-from laundry.models import LaundryRoom, LaundrySnapshot
+from laundry.api_wrapper import (
+    MAX_WORKERS,
+    all_status,
+    fetch_rooms,
+    room_status,
+    save_data,
+    status_version,
+)
+from laundry.models import LaundryRoom, LaundrySnapshot, LaundryUsageRollup
 from tests.laundry.test_commands import mock_laundry_get
 
 
@@ -158,3 +168,116 @@ class TestSaveData(TestCase):
         save_data()
 
         self.assertEqual(LaundrySnapshot.objects.all().count(), 6)
+
+    def test_save_data_bulk(self):
+        # rooms are matched by room_id, so rooms sharing a name are saved separately
+        LaundryRoom.objects.filter(room_id=14100).update(name="Harnwell 10th Floor")
+
+        with self.assertNumQueries(5):
+            data = save_data()
+
+        self.assertEqual(set(data), {14089, 14099, 14100})
+        self.assertEqual(
+            set(LaundrySnapshot.objects.values_list("room__room_id", flat=True)),
+            {14089, 14099, 14100},
+        )
+
+    def test_save_data_rollups(self):
+        save_data()
+        save_data()
+
+        # both snapshots of each room land in the same hour
+        self.assertEqual(LaundryUsageRollup.objects.count(), 3)
+        for rollup in LaundryUsageRollup.objects.all():
+            snapshots = LaundrySnapshot.objects.filter(room=rollup.room)
+            self.assertEqual(rollup.count, 2)
+            self.assertEqual(rollup.available_washers, sum(s.available_washers for s in snapshots))
+            self.assertEqual(rollup.available_dryers, sum(s.available_dryers for s in snapshots))
+
+
+class StubLaundryHandler(BaseHTTPRequestHandler):
+    """
+    Serves the same room for every `/rooms/<id>/machines` request after `delay` seconds.
+    Rooms listed in `stalled` take `stall` seconds instead, and rooms listed in `malformed`
+    are missing machine fields.
+    """
+
+    delay = 0.2
+    stall = 2
+    stalled = set()
+    malformed = set()
+
+    with open("tests/laundry/mock_rooms_request_14089.json", "rb") as f:
+        body = f.read()
+
+    def do_GET(self):
+        room_id = int(self.path.split("/")[2])
+        time.sleep(self.stall if room_id in self.stalled else self.delay)
+        body = b'[{"isWasher": true}]' if room_id in self.malformed else self.body
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestConcurrentFetch(TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("localhost", 0), StubLaundryHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://localhost:{self.server.server_port}"
+        StubLaundryHandler.stalled = set()
+        StubLaundryHandler.malformed = set()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def create_rooms(self, count):
+        for i in range(count):
+            LaundryRoom.objects.create(room_id=i, name=f"Room {i}", location="Stub")
+
+    def test_fetches_concurrently(self):
+        # every worker has to be fetching a room at once for any of them to get past the barrier
+        barrier = threading.Barrier(MAX_WORKERS, timeout=5)
+
+        def parse(url, timeout):
+            barrier.wait()
+            return {"washers": {}, "dryers": {}, "details": [], "version": status_version([])}
+
+        self.create_rooms(MAX_WORKERS)
+        with mock.patch("laundry.api_wrapper.parse_a_room", side_effect=parse):
+            statuses = fetch_rooms(LaundryRoom.objects.all())
+
+        self.assertEqual(MAX_WORKERS, len(statuses))
+
+    def test_partial_results(self):
+        self.create_rooms(4)
+        StubLaundryHandler.stalled = {3}
+        with override_settings(LAUNDRY_URL=self.url):
+            statuses = fetch_rooms(LaundryRoom.objects.all(), timeout=1)
+
+        self.assertEqual({room.room_id for room in statuses}, {0, 1, 2})
+        for status in statuses.values():
+            self.assertEqual(status["washers"]["open"] + status["washers"]["running"], 3)
+
+    def test_malformed_room(self):
+        self.create_rooms(3)
+        StubLaundryHandler.malformed = {1}
+        with override_settings(LAUNDRY_URL=self.url):
+            statuses = fetch_rooms(LaundryRoom.objects.all())
+
+        self.assertEqual({room.room_id for room in statuses}, {0, 2})
+
+    def test_sweep_deadline(self):
+        self.create_rooms(4)
+        StubLaundryHandler.stalled = {2, 3}
+        with override_settings(LAUNDRY_URL=self.url):
+            start = time.monotonic()
+            statuses = fetch_rooms(LaundryRoom.objects.all(), deadline=1)
+
+        self.assertLess(time.monotonic() - start, StubLaundryHandler.stall)
+        self.assertEqual({room.room_id for room in statuses}, {0, 1})
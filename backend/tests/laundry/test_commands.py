@@ -1,4 +1,5 @@
 import csv
+import datetime
 import json
 from io import StringIO
 from unittest import mock
@@ -6,8 +7,9 @@ from unittest import mock
 from django.conf import settings
 from django.core.management import call_command
 from django.test import TestCase
+from django.utils import timezone
 
-from laundry.models import LaundryRoom, LaundrySnapshot
+from laundry.models import LaundryRoom, LaundrySnapshot, LaundryUsageRollup
 
 
 def mock_laundry_get(url, *args, **kwargs):
@@ -66,6 +68,47 @@ class TestGetSnapshot(TestCase):
         self.assertEqual(LaundrySnapshot.objects.all().count(), 3)
 
 
+class TestBackfillLaundryUsage(TestCase):
+    def setUp(self):
+        self.room = LaundryRoom.objects.create(
+            room_id=14089,
+            name="English House",
+            location="English House",
+            location_id=14146,
+            total_washers=3,
+            total_dryers=3,
+        )
+        self.now = timezone.localtime().replace(hour=12, minute=0, second=0, microsecond=0)
+        for days, minutes, washers in [(0, 0, 1), (0, 30, 2), (0, 60, 3), (10, 0, 3)]:
+            LaundrySnapshot.objects.create(
+                room=self.room,
+                date=self.now - datetime.timedelta(days=days, minutes=-minutes),
+                available_washers=washers,
+                available_dryers=0,
+            )
+
+    def test_backfill(self):
+        out = StringIO()
+        call_command("backfill_laundry_usage", stdout=out)
+        self.assertEqual("Rolled up 3 hours of laundry usage!\n", out.getvalue())
+
+        noon = LaundryUsageRollup.objects.get(date=self.now.date(), hour=12)
+        self.assertEqual(noon.available_washers, 3)
+        self.assertEqual(noon.count, 2)
+        self.assertTrue(LaundryUsageRollup.objects.filter(date=self.now.date(), hour=13).exists())
+
+        # rerunning doesn't double count
+        call_command("backfill_laundry_usage", stdout=StringIO())
+        self.assertEqual(LaundryUsageRollup.objects.count(), 3)
+        self.assertEqual(LaundryUsageRollup.objects.get(pk=noon.pk).available_washers, 3)
+
+    def test_no_snapshots(self):
+        LaundrySnapshot.objects.all().delete()
+        out = StringIO()
+        call_command("backfill_laundry_usage", stdout=out)
+        self.assertEqual("No snapshots to roll up!\n", out.getvalue())
+
+
 @mock.patch("laundry.api_wrapper.get_validated", mock_laundry_get)
 class TestLaundryRoomMigration(TestCase):
     def test_db_populate(self):
@@ -135,3 +178,42 @@ class TestUpdateLaundryRooms(TestCase):
         ]
         # assert that the mock was called with this
         mock_laundry_write.assert_called_with(expected)
+
+    @mock.patch("laundry.management.commands.update_laundry_rooms.write_file")
+    def test_sync_rooms(self, mock_laundry_write):
+        LaundryRoom.objects.create(
+            room_id=14089,
+            name="English House",
+            location="English House",
+            location_id=14146,
+            total_washers=3,
+            total_dryers=3,
+        )
+        LaundryRoom.objects.create(
+            room_id=14099,
+            name="Harnwell 10th Floor",
+            location="Harnwell College House",
+            location_id=14150,
+            total_washers=2,
+            total_dryers=3,
+        )
+        LaundryRoom.objects.create(room_id=1, name="Old Room", location="Old", location_id=1)
+
+        out = StringIO()
+        call_command("update_laundry_rooms", stdout=out)
+        self.assertEqual(
+            "Added 1 rooms: Harnwell 12th Floor\n"
+            "Changed 1 rooms: Harnwell 10th Floor\n"
+            "Removed 1 rooms: Old Room\n"
+            "Removed rooms were kept in the database, run with --delete-removed to delete them.\n",
+            out.getvalue(),
+        )
+        self.assertEqual(LaundryRoom.objects.get(room_id=14099).total_washers, 3)
+        self.assertEqual(LaundryRoom.objects.count(), 4)
+
+        out = StringIO()
+        call_command("update_laundry_rooms", "--delete-removed", stdout=out)
+        self.assertEqual(
+            "Added 0 rooms\nChanged 0 rooms\nRemoved 1 rooms: Old Room\n", out.getvalue()
+        )
+        self.assertFalse(LaundryRoom.objects.filter(room_id=1).exists())
@@ -0,0 +1,164 @@
+import datetime
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from requests.exceptions import ConnectionError
+from rest_framework.test import APIClient
+
+from laundry.models import LaundryMachineSubscription, LaundryRoom
+from laundry.tasks import notify_machine_finished
+from tests.laundry.test_commands import mock_laundry_get
+from user.models import IOSNotificationToken, NotificationService
+
+
+User = get_user_model()
+
+
+def mock_laundry_get_finished(url, *args, **kwargs):
+    # every machine in the room has finished
+    machines = mock_laundry_get(url)
+    for machine in machines:
+        machine["currentStatus"]["statusId"] = "COMPLETE"
+    return machines
+
+
+@mock.patch("laundry.tasks.notify_machine_finished.apply_async")
+@mock.patch("laundry.api_wrapper.get_validated", mock_laundry_get)
+class MachineSubscriptionTestCase(TestCase):
+    def setUp(self):
+        self.room = LaundryRoom.objects.create(
+            room_id=14089,
+            name="English House",
+            location="English House",
+            location_id=14146,
+            total_washers=3,
+            total_dryers=3,
+        )
+        self.user = User.objects.create_user("user", "user@a.com", "user")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_subscribe(self, mock_apply_async):
+        response = self.client.post(reverse("machine-subscription", args=[14089, "442886"]))
+        self.assertEqual(201, response.status_code)
+
+        subscription = LaundryMachineSubscription.objects.get()
+        self.assertEqual(subscription.user, self.user)
+        self.assertEqual(subscription.machine_id, "442886")
+        # receivedAt plus remainingSeconds
+        self.assertEqual(
+            subscription.finishes_at,
+            datetime.datetime(2024, 10, 27, 17, 20, 12, 917000, tzinfo=datetime.timezone.utc),
+        )
+        mock_apply_async.assert_called_once_with(
+            (subscription.id, subscription.finishes_at.isoformat()), eta=subscription.finishes_at
+        )
+
+        # subscribing again doesn't duplicate the subscription or its check
+        response = self.client.post(reverse("machine-subscription", args=[14089, "442886"]))
+        self.assertEqual(201, response.status_code)
+        self.assertEqual(1, LaundryMachineSubscription.objects.count())
+        mock_apply_async.assert_called_once()
+
+    def test_subscribe_not_running(self, mock_apply_async):
+        response = self.client.post(reverse("machine-subscription", args=[14089, "442890"]))
+        self.assertEqual(400, response.status_code)
+        response = self.client.post(reverse("machine-subscription", args=[14089, "1"]))
+        self.assertEqual(404, response.status_code)
+        self.assertFalse(LaundryMachineSubscription.objects.exists())
+        mock_apply_async.assert_not_called()
+
+    def test_unsubscribe(self, mock_apply_async):
+        self.client.post(reverse("machine-subscription", args=[14089, "442886"]))
+        response = self.client.delete(reverse("machine-subscription", args=[14089, "442886"]))
+        self.assertEqual(200, response.status_code)
+        self.assertFalse(LaundryMachineSubscription.objects.exists())
+
+    def test_unauthenticated(self, mock_apply_async):
+        self.client.logout()
+        response = self.client.post(reverse("machine-subscription", args=[14089, "442886"]))
+        self.assertEqual(403, response.status_code)
+
+
+@mock.patch("user.notifications.ios_send_notification")
+@mock.patch("laundry.tasks.notify_machine_finished.apply_async")
+class NotifyMachineFinishedTestCase(TestCase):
+    def setUp(self):
+        self.room = LaundryRoom.objects.create(room_id=14089, name="English House")
+        self.user = User.objects.create_user("user", "user@a.com", "user")
+        IOSNotificationToken.objects.create(user=self.user, token="token")
+        NotificationService.objects.create(name="LAUNDRY").enabled_users.add(self.user)
+        self.subscription = LaundryMachineSubscription.objects.create(
+            user=self.user, room=self.room, machine_id="442886", finishes_at=timezone.now()
+        )
+
+    @mock.patch("laundry.api_wrapper.get_validated", mock_laundry_get_finished)
+    def test_finished(self, mock_apply_async, mock_send):
+        notify_machine_finished(self.subscription.id)
+
+        mock_send.assert_called_once()
+        tokens, title, body, urgent = mock_send.call_args.args
+        self.assertEqual(["token"], tokens)
+        self.assertIn("English House", body)
+        mock_apply_async.assert_not_called()
+        self.assertFalse(LaundryMachineSubscription.objects.exists())
+
+    @mock.patch("laundry.api_wrapper.get_validated", mock_laundry_get)
+    def test_still_running(self, mock_apply_async, mock_send):
+        notify_machine_finished(self.subscription.id)
+
+        # the mock data finished long ago, so the task checks back shortly
+        mock_send.assert_not_called()
+        subscription = LaundryMachineSubscription.objects.get()
+        self.assertGreater(subscription.finishes_at, timezone.now())
+        mock_apply_async.assert_called_once_with(
+            (subscription.id, subscription.finishes_at.isoformat()), eta=subscription.finishes_at
+        )
+
+    @mock.patch("laundry.api_wrapper.get_validated", mock_laundry_get)
+    def test_gives_up(self, mock_apply_async, mock_send):
+        self.subscription.created_at = timezone.now() - datetime.timedelta(days=1)
+        self.subscription.save()
+
+        notify_machine_finished(self.subscription.id)
+
+        mock_send.assert_not_called()
+        mock_apply_async.assert_not_called()
+        self.assertFalse(LaundryMachineSubscription.objects.exists())
+
+    @mock.patch("laundry.api_wrapper.get_validated", mock_laundry_get_finished)
+    def test_service_disabled(self, mock_apply_async, mock_send):
+        NotificationService.objects.get(name="LAUNDRY").enabled_users.clear()
+        notify_machine_finished(self.subscription.id)
+        mock_send.assert_not_called()
+
+    @mock.patch("laundry.api_wrapper.get_validated", side_effect=ConnectionError)
+    def test_api_unreachable(self, mock_get, mock_apply_async, mock_send):
+        notify_machine_finished(self.subscription.id)
+
+        # checks back shortly instead of dropping the subscription
+        mock_send.assert_not_called()
+        subscription = LaundryMachineSubscription.objects.get()
+        self.assertGreater(subscription.finishes_at, timezone.now())
+        mock_apply_async.assert_called_once_with(
+            (subscription.id, subscription.finishes_at.isoformat()), eta=subscription.finishes_at
+        )
+
+    @mock.patch("laundry.api_wrapper.get_validated", mock_laundry_get_finished)
+    def test_superseded(self, mock_apply_async, mock_send):
+        # a check scheduled for an earlier finish time than the subscription's
+        earlier = self.subscription.finishes_at - datetime.timedelta(minutes=5)
+        notify_machine_finished(self.subscription.id, earlier.isoformat())
+        mock_send.assert_not_called()
+        self.assertTrue(LaundryMachineSubscription.objects.exists())
+
+        notify_machine_finished(self.subscription.id, self.subscription.finishes_at.isoformat())
+        mock_send.assert_called_once()
+
+    def test_unsubscribed(self, mock_apply_async, mock_send):
+        self.subscription.delete()
+        notify_machine_finished(self.subscription.id)
+        mock_send.assert_not_called()
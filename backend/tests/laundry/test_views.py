@@ -1,13 +1,28 @@
+import datetime
 import json
 from unittest import mock
 
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from django.utils import timezone
+from requests.exceptions import ConnectionError, HTTPError
 from rest_framework.test import APIClient
 
-from laundry.models import LaundryRoom, LaundrySnapshot
+from laundry.api_wrapper import (
+    MAX_CONSECUTIVE_FAILURES,
+    ROOM_VERSION_KEY,
+    cached_room_machines,
+    check_is_working,
+    get_health,
+    get_room_url,
+    get_validated,
+    rollup_snapshots,
+    save_data,
+)
+from laundry.models import LaundryRoom, LaundrySnapshot, LaundryUsageRollup
+from laundry.views import HallForecast
 from tests.laundry.test_commands import mock_laundry_get
 
 
@@ -151,6 +166,145 @@ class MultipleHallInfoViewTestCase(TestCase):
         response = self.client.get(reverse("multiple-hall-info", args=["1000000"]))
         self.assertEqual(404, response.status_code)
 
+    def test_partial_hall_error(self):
+        response = self.client.get(reverse("multiple-hall-info", args=["14089,1000000"]))
+        self.assertEqual(404, response.status_code)
+
+    def test_batched(self):
+        for room in LaundryRoom.objects.all():
+            LaundrySnapshot.objects.create(room=room, available_washers=1, available_dryers=2)
+        hour = timezone.localtime().replace(minute=0, second=0, microsecond=0)
+        rollup_snapshots(hour, hour + datetime.timedelta(hours=1))
+
+        # the number of queries doesn't grow with the number of rooms
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("multiple-hall-info", args=["14089"]))
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("multiple-hall-info", args=["14100,14089,14099"]))
+
+        rooms = response.json()["rooms"]
+        self.assertEqual([14100, 14089, 14099], [room["id"] for room in rooms])
+        for room in rooms:
+            usage = room["usage_data"]
+            self.assertEqual(LaundryRoom.objects.get(room_id=room["id"]).name, usage["hall_name"])
+            self.assertEqual(1, usage["washer_data"][str(hour.hour)])
+            self.assertEqual(2, usage["dryer_data"][str(hour.hour)])
+
+
+@override_settings(
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+)
+class RoomStatusCacheTestCase(TestCase):
+    def setUp(self):
+        LaundryRoom.objects.get_or_create(
+            room_id=14089,
+            name="English House",
+            location="English House",
+            location_id=14146,
+            total_washers=3,
+            total_dryers=3,
+        )
+        LaundryRoom.objects.get_or_create(
+            room_id=14099,
+            name="Harnwell 10th Floor",
+            location="Harnwell College House",
+            location_id=14150,
+            total_washers=3,
+            total_dryers=3,
+        )
+        self.client = APIClient()
+        cache.clear()
+
+    @mock.patch("laundry.api_wrapper.get_validated", side_effect=mock_laundry_get)
+    def test_shared_between_views(self, mock_get):
+        # distinct URLs, so none of these are served from the page cache
+        self.client.get(reverse("hall-info", args=[14089]))
+        self.client.get(reverse("multiple-hall-info", args=["14089,14099"]))
+        self.client.get(reverse("multiple-hall-info", args=["14099,14089"]))
+        self.client.get(reverse("multiple-hall-info", args=["14099"]))
+
+        # one upstream call per room
+        self.assertEqual(2, mock_get.call_count)
+
+    @mock.patch("laundry.api_wrapper.get_validated", mock_laundry_get)
+    def test_not_modified(self):
+        response = self.client.get(reverse("hall-info", args=[14089]))
+        etag = response["ETag"]
+        self.assertEqual(f'"{response.json()["machines"]["version"]}"', etag)
+
+        response = self.client.get(reverse("hall-info", args=[14089]), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(304, response.status_code)
+        self.assertEqual(b"", response.content)
+
+        url = reverse("multiple-hall-info", args=["14089,14099"])
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(304, self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code)
+        # the 304 is not cached for clients without the ETag
+        self.assertEqual(200, self.client.get(url).status_code)
+
+    @mock.patch("laundry.api_wrapper.get_validated", mock_laundry_get)
+    def test_since(self):
+        machines = cached_room_machines(14089)
+
+        # an older version where the first machine had a different status and one more machine
+        details = [{**machines["details"][0], "status": "IN_USE"}, *machines["details"][1:]]
+        details.append({**details[-1], "id": "removed"})
+        cache.set(ROOM_VERSION_KEY.format(room_id=14089, version="old"), details)
+
+        response = self.client.get(reverse("hall-info", args=[14089]), {"since": "old"})
+        delta = response.json()["machines"]
+        self.assertEqual([machines["details"][0]["id"]], [m["id"] for m in delta["details"]])
+        self.assertEqual(["removed"], delta["removed"])
+        self.assertEqual("old", delta["since"])
+        self.assertEqual(machines["version"], delta["version"])
+
+        response = self.client.get(
+            reverse("multiple-hall-info", args=["14089,14099"]),
+            {"since": f"old,{machines['version']}"},
+        )
+        rooms = response.json()["rooms"]
+        self.assertEqual(1, len(rooms[0]["machines"]["details"]))
+        # an unknown version gets the full status
+        self.assertNotIn("since", rooms[1]["machines"])
+
+        response = self.client.get(reverse("multiple-hall-info", args=["14089"]), {"since": "a,b"})
+        self.assertEqual(400, response.status_code)
+
+    def test_upstream_http_error(self):
+        def mock_get(url, *args, **kwargs):
+            if "/rooms/14099/" in url:
+                return mock_response(500)
+            response = mock_response(200)
+            response.json.return_value = mock_laundry_get(url)
+            return response
+
+        with mock.patch("laundry.api_wrapper.session.get", side_effect=mock_get):
+            save_data()
+            response = self.client.get(reverse("hall-info", args=[14099]))
+            rooms = self.client.get(reverse("multiple-hall-info", args=["14089,14099"]))
+
+        # the failing room is saved and served without any machines
+        self.assertEqual(2, LaundrySnapshot.objects.count())
+        self.assertEqual(200, response.status_code)
+        self.assertEqual([], response.json()["machines"]["details"])
+        self.assertEqual(200, rooms.status_code)
+        self.assertNotEqual([], rooms.json()["rooms"][0]["machines"]["details"])
+        self.assertEqual([], rooms.json()["rooms"][1]["machines"]["details"])
+
+    @mock.patch("laundry.api_wrapper.session.get", side_effect=ConnectionError)
+    def test_upstream_unreachable(self, mock_get):
+        response = self.client.get(reverse("hall-info", args=[14089]))
+        self.assertEqual(503, response.status_code)
+        self.assertEqual("The laundry api is currently unavailable.", response.json()["error"])
+
+        response = self.client.get(reverse("multiple-hall-info", args=["14089,14099"]))
+        self.assertEqual(503, response.status_code)
+        self.assertEqual("The laundry api is currently unavailable.", response.json()["error"])
+
 
 @mock.patch("laundry.api_wrapper.get_validated", mock_laundry_get)
 class HallUsageViewTestCase(TestCase):
@@ -183,6 +337,8 @@ class HallUsageViewTestCase(TestCase):
         self.snapshot = LaundrySnapshot.objects.create(
             room=self.laundry_room, available_washers=3, available_dryers=3
         )
+        hour = timezone.localtime().replace(minute=0, second=0, microsecond=0)
+        rollup_snapshots(hour, hour + datetime.timedelta(hours=1))
         self.client = APIClient()
 
     def test_response(self):
@@ -196,6 +352,68 @@ class HallUsageViewTestCase(TestCase):
         self.assertEqual(self.snapshot.available_dryers, res_json["dryer_data"][str(hour)])
 
 
+class HallForecastViewTestCase(TestCase):
+    def setUp(self):
+        self.laundry_room = LaundryRoom.objects.create(
+            room_id=14089,
+            name="English House",
+            location="English House",
+            location_id=14146,
+            total_washers=3,
+            total_dryers=3,
+        )
+        self.client = APIClient()
+
+    def add_week(self, weeks_ago, washers, dryers):
+        # every hour of the same weekday `weeks_ago` weeks ago, averaged over 2 snapshots
+        date = timezone.localtime().date() - datetime.timedelta(weeks=weeks_ago)
+        for day in [date, date + datetime.timedelta(days=1)]:
+            LaundryUsageRollup.objects.bulk_create(
+                LaundryUsageRollup(
+                    room=self.laundry_room,
+                    date=day,
+                    hour=hour,
+                    available_washers=2 * washers,
+                    available_dryers=2 * dryers,
+                    count=2,
+                )
+                for hour in range(24)
+            )
+
+    def get_forecast(self, **params):
+        return self.client.get(reverse("hall-forecast", args=[self.laundry_room.room_id]), params)
+
+    def test_constant_history(self):
+        self.add_week(1, 2, 1)
+        res_json = self.get_forecast(hours=3).json()
+
+        self.assertEqual(3, len(res_json["forecast"]))
+        for hour in res_json["forecast"]:
+            self.assertEqual({"expected": 2, "low": 2, "high": 2}, hour["washers"])
+            self.assertEqual({"expected": 1, "low": 1, "high": 1}, hour["dryers"])
+
+    def test_recent_weeks_weigh_more(self):
+        self.add_week(1, 1, 0)
+        self.add_week(2, 3, 0)
+        washers = self.get_forecast().json()["forecast"][0]["washers"]
+
+        self.assertGreater(washers["expected"], 1)
+        self.assertLess(washers["expected"], 2)
+        self.assertLess(washers["low"], washers["expected"])
+        self.assertGreater(washers["high"], washers["expected"])
+        self.assertLessEqual(washers["high"], 3)
+
+    def test_no_history(self):
+        res_json = self.get_forecast().json()
+
+        self.assertEqual(HallForecast.default_hours, len(res_json["forecast"]))
+        self.assertIsNone(res_json["forecast"][0]["washers"])
+
+    def test_invalid_hours(self):
+        self.assertEqual(400, self.get_forecast(hours="a").status_code)
+        self.assertEqual(400, self.get_forecast(hours=HallForecast.max_hours + 1).status_code)
+
+
 @mock.patch("laundry.api_wrapper.get_validated", mock_laundry_get)
 class PreferencesTestCase(TestCase):
     def setUp(self):
@@ -245,3 +463,67 @@ class PreferencesTestCase(TestCase):
         res_json = json.loads(response.content)
 
         self.assertIn(self.other_laundry_room.room_id, res_json["rooms"])
+
+
+def mock_response(status_code):
+    response = mock.Mock(status_code=status_code)
+    response.json.return_value = []
+    if status_code >= 400:
+        response.raise_for_status.side_effect = HTTPError(f"{status_code} Error")
+    return response
+
+
+@override_settings(
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+)
+class StatusTestCase(TestCase):
+    def setUp(self):
+        LaundryRoom.objects.create(room_id=14089, name="English House")
+        self.client = APIClient()
+        cache.clear()
+
+    @mock.patch("laundry.api_wrapper.session.get", return_value=mock_response(200))
+    def test_probe_when_stale(self, mock_get):
+        response = self.client.get(reverse("status"))
+        self.assertTrue(response.json()["is_working"])
+
+        # probes a single room rather than every location
+        mock_get.assert_called_once()
+        self.assertIn("/rooms/14089/machines", mock_get.call_args.args[0])
+
+        # answered from the health state afterwards
+        self.client.get(reverse("status"))
+        mock_get.assert_called_once()
+
+    @mock.patch("laundry.api_wrapper.session.get", return_value=mock_response(500))
+    def test_failures(self, mock_get):
+        for _ in range(MAX_CONSECUTIVE_FAILURES - 1):
+            get_validated(get_room_url(14089))
+        self.assertTrue(self.client.get(reverse("status")).json()["is_working"])
+
+        get_validated(get_room_url(14089))
+        response = self.client.get(reverse("status")).json()
+        self.assertFalse(response["is_working"])
+        self.assertIsNotNone(response["error_msg"])
+        self.assertEqual(MAX_CONSECUTIVE_FAILURES, mock_get.call_count)
+
+        health = get_health()
+        self.assertEqual(MAX_CONSECUTIVE_FAILURES, health["consecutive_failures"])
+        self.assertGreater(health["error_rate"], 0)
+        self.assertIsNone(health["last_success"])
+
+    @mock.patch("laundry.api_wrapper.session.get", side_effect=ConnectionError)
+    def test_recovery(self, mock_get):
+        for _ in range(MAX_CONSECUTIVE_FAILURES):
+            with self.assertRaises(ConnectionError):
+                get_validated(get_room_url(14089))
+        self.assertFalse(check_is_working())
+
+        mock_get.side_effect = None
+        mock_get.return_value = mock_response(200)
+        get_validated(get_room_url(14089))
+        self.assertTrue(check_is_working())
@@ -0,0 +1,79 @@
+import threading
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from utils.cache import shared_token, single_flight
+
+
+@override_settings(
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+)
+class SingleFlightTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_hit(self):
+        refresh = mock.Mock(return_value="value")
+        self.assertEqual("value", single_flight("key", refresh, 60))
+        self.assertEqual("value", single_flight("key", refresh, 60))
+        refresh.assert_called_once()
+
+    def test_concurrent_misses(self):
+        calls = []
+
+        def refresh():
+            calls.append(1)
+            time.sleep(0.2)
+            return "value"
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(single_flight("key", refresh, 60)))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(["value"] * 8, results)
+        self.assertEqual(1, len(calls))
+
+    def test_failed_refresh(self):
+        def failing_refresh():
+            raise ValueError
+
+        with self.assertRaises(ValueError):
+            single_flight("key", failing_refresh, 60)
+
+        # the lock is released so the next caller refreshes straight away
+        self.assertEqual("value", single_flight("key", lambda: "value", 60, lock_timeout=1))
+
+
+@override_settings(
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+)
+class SharedTokenTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_refresh_ahead(self):
+        fetch = mock.Mock(side_effect=[("first", 61), ("second", 61)])
+        self.assertEqual("first", shared_token("token", fetch, refresh_ahead=60))
+        self.assertEqual("first", shared_token("token", fetch, refresh_ahead=60))
+
+        # refreshed 60 seconds before the token expires
+        time.sleep(1.1)
+        self.assertEqual("second", shared_token("token", fetch, refresh_ahead=60))
+        self.assertEqual(2, fetch.call_count)
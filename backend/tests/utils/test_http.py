@@ -0,0 +1,49 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from django.test import TestCase
+
+from utils import http
+
+
+class OKHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, *args):
+        pass
+
+
+class PooledSessionTestCase(TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), OKHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_session_per_host(self):
+        self.assertIs(http.get_session(self.url), http.get_session(f"{self.url}other"))
+        self.assertIsNot(http.get_session(self.url), http.get_session("https://example.com/"))
+
+    def test_connections_reused(self):
+        for _ in range(5):
+            self.assertEqual({}, http.get(self.url).json())
+        stats = http.connection_stats()[f"127.0.0.1:{self.server.server_port}"]
+        self.assertEqual({"requests": 5, "connections": 1}, stats)
+
+    def test_default_timeout(self):
+        session = http.PooledSession(timeout=3)
+        with mock.patch("requests.Session.request") as mock_request:
+            session.get(self.url)
+            self.assertEqual(3, mock_request.call_args.kwargs["timeout"])
+            session.get(self.url, timeout=1)
+            self.assertEqual(1, mock_request.call_args.kwargs["timeout"])
@@ -0,0 +1,105 @@
+import datetime
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from laundry.models import LaundryRoom, LaundrySnapshot
+from penndata.models import FitnessRoom, FitnessSnapshot
+from utils.retention import compact_snapshots
+
+
+FIELDS = ["available_washers", "available_dryers"]
+
+
+class CompactSnapshotsTestCase(TestCase):
+    def setUp(self):
+        self.room = LaundryRoom.objects.create(room_id=14089, name="English House")
+        self.noon = timezone.localtime().replace(hour=12, minute=0, second=0, microsecond=0)
+
+    def snapshot(self, days, minutes, washers):
+        LaundrySnapshot.objects.create(
+            room=self.room,
+            date=self.noon - datetime.timedelta(days=days) + datetime.timedelta(minutes=minutes),
+            available_washers=washers,
+            available_dryers=washers * 2,
+        )
+
+    def test_recent_untouched(self):
+        for minutes in [0, 15, 30, 45]:
+            self.snapshot(1, minutes, 1)
+        self.assertEqual(compact_snapshots(LaundrySnapshot, FIELDS), 0)
+        self.assertEqual(LaundrySnapshot.objects.count(), 4)
+
+    def test_hourly(self):
+        for minutes, washers in [(0, 1), (15, 2), (30, 2), (45, 3), (60, 5)]:
+            self.snapshot(40, minutes, washers)
+
+        removed = compact_snapshots(LaundrySnapshot, FIELDS)
+
+        self.assertEqual(removed, 3)
+        noon, one = LaundrySnapshot.objects.order_by("date")
+        self.assertEqual(timezone.localtime(noon.date), self.noon - datetime.timedelta(days=40))
+        self.assertEqual(noon.available_washers, 2)
+        self.assertEqual(noon.available_dryers, 4)
+        self.assertEqual(one.available_washers, 5)
+
+        # compacting again is a no-op
+        self.assertEqual(compact_snapshots(LaundrySnapshot, FIELDS), 0)
+
+    def test_daily(self):
+        for minutes, washers in [(-120, 1), (0, 2), (240, 6)]:
+            self.snapshot(400, minutes, washers)
+        self.snapshot(40, 0, 1)
+
+        removed = compact_snapshots(LaundrySnapshot, FIELDS)
+
+        self.assertEqual(removed, 2)
+        self.assertEqual(LaundrySnapshot.objects.count(), 2)
+        daily = LaundrySnapshot.objects.order_by("date").first()
+        self.assertEqual(timezone.localtime(daily.date).hour, 0)
+        self.assertEqual(daily.available_washers, 3)
+
+    def test_compacted_days_skipped(self):
+        self.snapshot(300, 0, 1)
+        self.snapshot(300, 60, 1)
+        for minutes in [0, 15]:
+            self.snapshot(40, minutes, 1)
+        self.assertEqual(compact_snapshots(LaundrySnapshot, FIELDS), 1)
+
+        # finding the first day to compact for each policy is all a later run queries
+        with self.assertNumQueries(2):
+            self.assertEqual(compact_snapshots(LaundrySnapshot, FIELDS), 0)
+
+    def test_custom_policy(self):
+        for minutes in [0, 15]:
+            self.snapshot(5, minutes, 1)
+        self.assertEqual(compact_snapshots(LaundrySnapshot, FIELDS, raw_days=2), 1)
+
+    def test_fitness_command(self):
+        room = FitnessRoom.objects.create(name="Pottruck")
+        date = self.noon - datetime.timedelta(days=40)
+        FitnessSnapshot.objects.create(room=room, date=date, count=10, capacity=None)
+        FitnessSnapshot.objects.create(
+            room=room, date=date + datetime.timedelta(minutes=30), count=21, capacity=50.0
+        )
+
+        out = StringIO()
+        call_command("compact_fitness_snapshots", stdout=out)
+
+        self.assertEqual(out.getvalue(), "Removed 1 Fitness Snapshots!\n")
+        snapshot = FitnessSnapshot.objects.get()
+        self.assertEqual(snapshot.count, 16)
+        self.assertEqual(snapshot.capacity, 50.0)
+
+    def test_laundry_command(self):
+        for minutes in [0, 15]:
+            self.snapshot(40, minutes, 1)
+
+        out = StringIO()
+        call_command("compact_laundry_snapshots", "--raw-days", "60", stdout=out)
+        self.assertEqual(out.getvalue(), "Removed 0 Laundry Snapshots!\n")
+
+        call_command("compact_laundry_snapshots", stdout=out)
+        self.assertEqual(LaundrySnapshot.objects.count(), 1)
@@ -25,6 +25,8 @@ from apns2.client import APNsClient
 from apns2.payload import Payload
 from celery import shared_task
 
+from user.models import AndroidNotificationToken, IOSNotificationToken
+
 
 class NotificationWrapper(ABC):
     def send_notification(self, tokens, title, body, urgent):
@@ -169,3 +171,31 @@ def ios_send_dev_notification(tokens, title, body, urgent):
 @shared_task(name="notifications.ios_send_dev_shadow_notification")
 def ios_send_dev_shadow_notification(tokens, body):
     IOSNotificationDevSender.send_shadow_notification(tokens, body)
+
+
+def send_push_notifications(users, service, title, body, urgent=False):
+    """
+    Sends a push notification to every device of the users in the `users` queryset
+    that have `service` enabled, and returns those users
+    """
+
+    users_with_service = users.filter(notificationservice__name=service)
+
+    for tokens, send in [
+        (
+            IOSNotificationToken.objects.filter(user__in=users_with_service, is_dev=False),
+            ios_send_notification,
+        ),
+        (
+            IOSNotificationToken.objects.filter(user__in=users_with_service, is_dev=True),
+            ios_send_dev_notification,
+        ),
+        (
+            AndroidNotificationToken.objects.filter(user__in=users_with_service),
+            android_send_notification,
+        ),
+    ]:
+        if tokens_list := list(tokens.values_list("token", flat=True)):
+            send(tokens_list, title, body, urgent)
+
+    return users_with_service
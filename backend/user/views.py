@@ -10,11 +10,7 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from user.models import AndroidNotificationToken, IOSNotificationToken, NotificationService
-from user.notifications import (
-    android_send_notification,
-    ios_send_dev_notification,
-    ios_send_notification,
-)
+from user.notifications import send_push_notifications
 from user.serializers import UserSerializer
 
 
@@ -138,32 +134,17 @@ class NotificationAlertView(APIView):
         service = request.data.get("service")
         title = request.data.get("title")
         body = request.data.get("body")
-        delay = max(request.data.get("delay", 0), 0)
         urgent = request.data.get("urgent", False)
 
         if None in [service, title, body]:
             return Response({"detail": "Missing required parameters."}, status=400)
 
-        if not (service_obj := NotificationService.objects.filter(name=service).first()):
+        if not NotificationService.objects.filter(name=service).exists():
             return Response({"detail": "Invalid service."}, status=400)
 
-        users_with_service = service_obj.enabled_users.filter(username__in=usernames)
-
-        ios_tokens = IOSNotificationToken.objects.filter(user__in=users_with_service, is_dev=False)
-        ios_dev_tokens = IOSNotificationToken.objects.filter(
-            user__in=users_with_service, is_dev=True
+        users_with_service = send_push_notifications(
+            User.objects.filter(username__in=usernames), service, title, body, urgent
         )
-        android_tokens = AndroidNotificationToken.objects.filter(user__in=users_with_service)
-
-        for tokens, send in [
-            (ios_tokens, ios_send_notification),
-            (ios_dev_tokens, ios_send_dev_notification),
-            (android_tokens, android_send_notification),
-        ]:
-            if tokens_list := list(tokens.values_list("token", flat=True)):
-                _ = delay
-                send(tokens_list, title, body, urgent)
-                # send.apply_async(args=(tokens_list, title, body, urgent), countdown=delay)
 
         users_with_service_usernames = users_with_service.values_list("username", flat=True)
         users_not_reached_usernames = list(set(usernames) - set(users_with_service_usernames))
@@ -1,4 +1,9 @@
+import time
 from enum import IntEnum
+from functools import wraps
+
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response
 
 
 class Cache(IntEnum):
@@ -7,3 +12,64 @@ class Cache(IntEnum):
     DAY = 24 * HOUR
     MONTH = 30 * DAY
     YEAR = 365 * DAY
+
+
+def single_flight(key, refresh, timeout, lock_timeout=10, poll_interval=0.05):
+    """
+    Returns the cached value for `key`, calling `refresh()` to repopulate it on a miss.
+    Only one caller across all processes refreshes a key at a time; everyone else waits
+    up to `lock_timeout` seconds for that result, and refreshes itself if the refresh
+    fails or takes longer than that.
+    `refresh()` must not return None. `timeout` is in seconds, or a function of the
+    refreshed value that returns seconds.
+    """
+
+    if (value := cache.get(key)) is not None:
+        return value
+
+    lock_key = f"{key}:lock"
+    if cache.add(lock_key, True, lock_timeout):
+        try:
+            value = refresh()
+            cache.set(key, value, timeout(value) if callable(timeout) else timeout)
+            return value
+        finally:
+            cache.delete(lock_key)
+
+    deadline = time.monotonic() + lock_timeout
+    while time.monotonic() < deadline:
+        time.sleep(poll_interval)
+        if (value := cache.get(key)) is not None:
+            return value
+        if cache.get(lock_key) is None:
+            break
+    return refresh()
+
+
+def shared_token(key, fetch, refresh_ahead=60):
+    """
+    Returns an OAuth access token shared by every thread and process.
+    `fetch()` requests a new token and returns a tuple of the token and its lifetime in
+    seconds. Tokens are dropped from the cache `refresh_ahead` seconds before they expire,
+    and only one caller fetches the next token while everyone else waits for it.
+    """
+
+    token, _ = single_flight(key, fetch, lambda fetched: max(fetched[1] - refresh_ahead, 1))
+    return token
+
+
+def conditional(view):
+    """
+    Answers GET requests whose If-None-Match matches the ETag set by `view` with a 304.
+    Meant to wrap `cache_page`, so that 304s are never cached and served to other clients,
+    and works on cached responses (which Django's `conditional_page` does not).
+    """
+
+    @wraps(view)
+    def wrapped_view(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        if request.method != "GET" or not response.has_header("ETag"):
+            return response
+        return get_conditional_response(request, etag=response["ETag"], response=response)
+
+    return wrapped_view
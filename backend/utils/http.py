@@ -0,0 +1,78 @@
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+# Connections kept alive per host. Hosts that are called concurrently can ask for more
+DEFAULT_POOL_SIZE = 10
+# Seconds to wait on an upstream API when the caller does not pass a timeout
+DEFAULT_TIMEOUT = 10
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+class PooledSession(requests.Session):
+    """
+    Session that keeps up to `pool_size` connections alive for reuse, and gives up on
+    requests after `timeout` seconds unless told otherwise.
+    """
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT):
+        super().__init__()
+        self.timeout = timeout
+        adapter = HTTPAdapter(pool_maxsize=pool_size)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+
+    def request(self, method, url, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().request(method, url, **kwargs)
+
+
+def get_session(url, pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT):
+    """
+    Returns the session shared by every request to the host of `url`, creating it with
+    `pool_size` and `timeout` the first time the host is used.
+    """
+
+    host = urlsplit(url).netloc
+    if (session := _sessions.get(host)) is not None:
+        return session
+    with _sessions_lock:
+        if host not in _sessions:
+            _sessions[host] = PooledSession(pool_size, timeout)
+        return _sessions[host]
+
+
+def request(method, url, **kwargs):
+    return get_session(url).request(method, url, **kwargs)
+
+
+def get(url, params=None, **kwargs):
+    return get_session(url).get(url, params=params, **kwargs)
+
+
+def post(url, data=None, json=None, **kwargs):
+    return get_session(url).post(url, data=data, json=json, **kwargs)
+
+
+def connection_stats():
+    """
+    Returns the number of requests sent and connections opened for each host in this
+    process. Fewer connections than requests means connections are being reused.
+    """
+
+    stats = {}
+    for host, session in list(_sessions.items()):
+        host_stats = stats[host] = {"requests": 0, "connections": 0}
+        for adapter in set(session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                if (pool := pools.get(key)) is not None:
+                    host_stats["requests"] += pool.num_requests
+                    host_stats["connections"] += pool.num_connections
+    return stats
@@ -0,0 +1,116 @@
+import datetime
+from collections import defaultdict
+
+from django.db import models, transaction
+from django.db.models import Count
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+
+# Default policy: raw snapshots for a month, hourly averages for a year, daily averages after
+RAW_DAYS = 30
+HOURLY_DAYS = 365
+
+# Largest number of ids sent in a single delete
+DELETE_BATCH_SIZE = 500
+
+
+def local_midnight(date):
+    return timezone.make_aware(datetime.datetime.combine(date, datetime.time()))
+
+
+def average(model, field, values):
+    values = [value for value in values if value is not None]
+    if not values:
+        return None
+    mean = sum(values) / len(values)
+    return round(mean) if isinstance(model._meta.get_field(field), models.IntegerField) else mean
+
+
+def compact_day(model, fields, start, end, hourly):
+    """
+    Replaces the snapshots of `model` taken between `start` and `end` with one snapshot per room
+    per hour (or per day if `hourly` is False) holding the average of each of `fields`.
+    Runs in its own transaction and returns the number of rows removed.
+    """
+
+    buckets = defaultdict(list)
+    for row in model.objects.filter(date__gte=start, date__lt=end).values(
+        "id", "room_id", "date", *fields
+    ):
+        bucket = timezone.localtime(row["date"]).replace(minute=0, second=0, microsecond=0)
+        if not hourly:
+            bucket = bucket.replace(hour=0)
+        buckets[(row["room_id"], bucket)].append(row)
+
+    # buckets with a single snapshot are already compacted
+    buckets = {key: rows for key, rows in buckets.items() if len(rows) > 1}
+    if not buckets:
+        return 0
+
+    ids = [row["id"] for rows in buckets.values() for row in rows]
+    with transaction.atomic():
+        for i in range(0, len(ids), DELETE_BATCH_SIZE):
+            model.objects.filter(id__in=ids[i : i + DELETE_BATCH_SIZE]).delete()
+        model.objects.bulk_create(
+            [
+                model(
+                    room_id=room_id,
+                    date=bucket,
+                    **{
+                        field: average(model, field, [row[field] for row in rows])
+                        for field in fields
+                    },
+                )
+                for (room_id, bucket), rows in buckets.items()
+            ]
+        )
+    return len(ids) - len(buckets)
+
+
+def first_uncompacted_day(model, start, end, hourly):
+    """
+    Returns the first day between `start` (or the first snapshot if None) and `end` on which a
+    room of `model` has more than one snapshot in an hour (or a day if `hourly` is False),
+    or None if every day is already compacted.
+    """
+
+    snapshots = model.objects.filter(date__lt=local_midnight(end))
+    if start is not None:
+        snapshots = snapshots.filter(date__gte=local_midnight(start))
+    bucket = (
+        snapshots.annotate(bucket=TruncHour("date") if hourly else TruncDay("date"))
+        .values("room_id", "bucket")
+        .annotate(count=Count("id"))
+        .filter(count__gt=1)
+        .order_by("bucket")
+        .values_list("bucket", flat=True)
+        .first()
+    )
+    return timezone.localtime(bucket).date() if bucket is not None else None
+
+
+def compact_snapshots(model, fields, raw_days=RAW_DAYS, hourly_days=HOURLY_DAYS):
+    """
+    Downsamples a snapshot model (anything with `room` and `date` fields) so that snapshots
+    older than `raw_days` become hourly averages of `fields` and snapshots older than
+    `hourly_days` become daily averages. Works through history one day at a time, so no
+    transaction holds more than a day of rows, starting from the first day that still needs
+    compacting so days compacted by earlier runs are not scanned again.
+    Returns the number of rows removed.
+    """
+
+    today = timezone.localtime().date()
+    raw_cutoff = today - datetime.timedelta(days=raw_days)
+    hourly_cutoff = min(today - datetime.timedelta(days=hourly_days), raw_cutoff)
+
+    removed = 0
+    for start, end, hourly in [(None, hourly_cutoff, False), (hourly_cutoff, raw_cutoff, True)]:
+        day = first_uncompacted_day(model, start, end, hourly)
+        while day is not None and day < end:
+            next_day = day + datetime.timedelta(days=1)
+            removed += compact_day(
+                model, fields, local_midnight(day), local_midnight(next_day), hourly
+            )
+            day = next_day
+    return removed
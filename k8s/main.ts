@@ -122,8 +122,48 @@ export class MyChart extends PennLabsChart {
       env: [{ name: "DJANGO_SETTINGS_MODULE", value: "pennmobile.settings.production" }]
     });
 
+    new CronJob(this, 'compact-laundry-snapshots', {
+      schedule: '30 4 * * *', // Every day at 4:30 AM
+      image: backendImage,
+      secret,
+      cmd: ["python", "manage.py", "compact_laundry_snapshots"],
+      env: [{ name: "DJANGO_SETTINGS_MODULE", value: "pennmobile.settings.production" }]
+    });
+
+    new CronJob(this, 'compact-fitness-snapshots', {
+      schedule: '45 4 * * *', // Every day at 4:45 AM
+      image: backendImage,
+      secret,
+      cmd: ["python", "manage.py", "compact_fitness_snapshots"],
+      env: [{ name: "DJANGO_SETTINGS_MODULE", value: "pennmobile.settings.production" }]
+    });
+
+    new CronJob(this, 'refresh-gsr-rooms', {
+      schedule: '15 5 * * *', // Every day at 5:15 AM
+      image: backendImage,
+      secret,
+      cmd: ["python", "manage.py", "refresh_gsr_rooms"],
+      env: [{ name: "DJANGO_SETTINGS_MODULE", value: "pennmobile.settings.production" }]
+    });
+
+    new CronJob(this, 'update-seas-status', {
+      schedule: '30 5 * * *', // Every day at 5:30 AM
+      image: backendImage,
+      secret,
+      cmd: ["python", "manage.py", "update_seas_status"],
+      env: [{ name: "DJANGO_SETTINGS_MODULE", value: "pennmobile.settings.production" }]
+    });
+
+    new CronJob(this, 'refresh-dining-venues', {
+      schedule: cronTime.everyHour(),
+      image: backendImage,
+      secret,
+      cmd: ["python", "manage.py", "refresh_venues"],
+      env: [{ name: "DJANGO_SETTINGS_MODULE", value: "pennmobile.settings.production" }]
+    });
+
     new CronJob(this, 'load-dining-menus', {
-      schedule: cronTime.everyDay(),
+      schedule: cronTime.everyHour(),
       image: backendImage,
       secret,
       cmd: ["python", "manage.py", "load_next_menu"],